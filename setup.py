@@ -19,7 +19,8 @@ setup(
     install_requires=read_requirements(),
     entry_points={
         "console_scripts": [
-            "xbot = xbot:xbot",
+            "xbot = xbot_commands.daemon:main",
+            "xbotd = xbotd:xbotd",
         ],
     },
 )
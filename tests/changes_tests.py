@@ -0,0 +1,75 @@
+import unittest
+
+from xbot.xbot_commands.changes import (
+    ManifestError,
+    chunked,
+    plan_changes,
+    upsert_batches,
+)
+
+CURRENT = [
+    {"id": "a", "name": "ingest-orders", "node_state": "active"},
+    {"id": "b", "name": "serve-orders", "node_state": "error"},
+    {"id": "c", "name": "dup", "node_state": "active"},
+    {"id": "d", "name": "dup", "node_state": "active"},
+]
+
+
+class TestPlanChanges(unittest.TestCase):
+    def test_only_listed_fields_are_compared(self):
+        """Test that items are updated only when a listed field differs."""
+        desired = [
+            {"id": "a", "node_state": "active"},
+            {"id": "b", "node_state": "active"},
+        ]
+        plan = plan_changes(desired, CURRENT, ["id"])
+        self.assertEqual(
+            plan["update"],
+            [{"id": "b", "name": "serve-orders", "node_state": "active"}],
+        )
+        self.assertEqual(plan["unchanged"], 1)
+        self.assertEqual(plan["create"], [])
+
+    def test_items_without_a_key_are_matched_by_name(self):
+        """Test that a unique name finds the item and an unknown name creates one."""
+        desired = [{"name": "serve-orders", "node_state": "active"}, {"name": "new"}]
+        plan = plan_changes(desired, CURRENT, ["id"])
+        self.assertEqual(plan["update"][0]["id"], "b")
+        self.assertEqual(plan["create"], [{"name": "new"}])
+
+    def test_names_shared_by_several_items_are_rejected(self):
+        """Test that an ambiguous name is an error rather than a new duplicate."""
+        with self.assertRaises(ManifestError):
+            plan_changes([{"name": "dup", "node_state": "error"}], CURRENT, ["id"])
+
+    def test_prune_deletes_unlisted_items(self):
+        """Test that only pruning removes items missing from the manifest."""
+        desired = [{"id": "a"}]
+        self.assertEqual(plan_changes(desired, CURRENT, ["id"])["delete"], [])
+        plan = plan_changes(desired, CURRENT, ["id"], prune=True)
+        self.assertEqual(plan["delete"], ["b", "c", "d"])
+
+    def test_composite_keys_and_duplicates(self):
+        """Test that ports are keyed by node and port number, and duplicates rejected."""
+        current = [{"node_id": "a", "port_number": 3000, "port_state": "open"}]
+        desired = [{"node_id": "a", "port_number": 3000, "port_state": "open"}]
+        self.assertEqual(
+            plan_changes(desired, current, ["node_id", "port_number"])["unchanged"], 1
+        )
+        with self.assertRaises(ManifestError):
+            plan_changes(desired * 2, current, ["node_id", "port_number"])
+
+
+class TestBatches(unittest.TestCase):
+    def test_upsert_batches_share_columns(self):
+        """Test that each bulk request only holds rows with the same columns."""
+        rows = [{"id": str(i), "name": "n"} for i in range(5)] + [{"name": "new"}]
+        batches = upsert_batches(rows, 2)
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1, 1])
+        for batch in batches:
+            self.assertEqual(len({frozenset(row) for row in batch}), 1)
+        self.assertEqual(chunked([1, 2, 3], 2), [[1, 2], [3]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from contextlib import redirect_stdout
+from unittest import mock
+
+import click
+
+from xbot.xbot_commands import daemon
+
+
+@click.group()
+def cli() -> None:
+    pass
+
+
+@cli.command()
+@click.argument("name")
+def hello(name: str) -> None:
+    click.echo(f"hello {name} from {os.path.basename(os.getcwd())}")
+
+
+@cli.command()
+@click.argument("code", type=int)
+def fail(code: int) -> None:
+    click.echo("failing")
+    sys.exit(code)
+
+
+@cli.command()
+def crash() -> None:
+    raise RuntimeError("boom")
+
+
+class TestRunCommand(unittest.TestCase):
+    def setUp(self):
+        self.cwd = tempfile.mkdtemp()
+
+    def request(self, *argv):
+        return {"argv": list(argv), "cwd": self.cwd, "isatty": False, "width": None}
+
+    def test_output_is_captured_in_the_client_directory(self):
+        """Test that a command runs in the client's directory and its output is returned."""
+        reply = daemon.run_command(cli, self.request("hello", "mesh"))
+        expected = f"hello mesh from {os.path.basename(self.cwd)}\n"
+        self.assertEqual(reply, {"output": expected, "exit_code": 0})
+        self.assertNotEqual(os.getcwd(), self.cwd)
+
+    def test_exit_code_is_propagated(self):
+        """Test that a command's exit code is returned with its output."""
+        reply = daemon.run_command(cli, self.request("fail", "3"))
+        self.assertEqual(reply, {"output": "failing\n", "exit_code": 3})
+
+    def test_usage_errors_exit_with_2(self):
+        """Test that click usage errors are reported with click's exit code."""
+        reply = daemon.run_command(cli, self.request("missing"))
+        self.assertEqual(reply["exit_code"], 2)
+        self.assertIn("No such command", reply["output"])
+
+    def test_exceptions_are_reported_without_killing_the_daemon(self):
+        """Test that an unexpected exception becomes a traceback and exit code 1."""
+        reply = daemon.run_command(cli, self.request("crash"))
+        self.assertEqual(reply["exit_code"], 1)
+        self.assertIn("RuntimeError: boom", reply["output"])
+
+    def test_completion_is_answered_in_process(self):
+        """Test that forwarded completion variables reach click and are then removed."""
+        request = self.request()
+        request["environ"] = {
+            "_XBOT_COMPLETE": "bash_complete",
+            "COMP_WORDS": "xbot he",
+            "COMP_CWORD": "1",
+            "PATH": "/nowhere",
+        }
+        reply = daemon.run_command(cli, request)
+        self.assertEqual(reply, {"output": "plain,hello\n", "exit_code": 0})
+        self.assertNotIn("_XBOT_COMPLETE", os.environ)
+        self.assertNotEqual(os.environ.get("PATH"), "/nowhere")
+
+
+class TestForward(unittest.TestCase):
+    def setUp(self):
+        self.socket_path = os.path.join(tempfile.mkdtemp(), "xbotd.sock")
+        patcher = mock.patch.object(daemon, "SOCKET_PATH", self.socket_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start_server(self, on_invalidate=None):
+        server = threading.Thread(
+            target=daemon.serve,
+            args=(cli, self.socket_path, 2.0),
+            kwargs={"on_invalidate": on_invalidate},
+            daemon=True,
+        )
+        server.start()
+        deadline = time.monotonic() + 5
+        while not os.path.exists(self.socket_path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return server
+
+    def forward(self, *argv):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            exit_code = daemon.forward(list(argv))
+        return exit_code, output.getvalue()
+
+    def test_round_trip_over_the_socket(self):
+        """Test that a forwarded command's output and exit code reach the client."""
+        self.start_server()
+        self.assertEqual(self.forward("fail", "4"), (4, "failing\n"))
+        exit_code, output = self.forward("hello", "mesh")
+        self.assertEqual(exit_code, 0)
+        self.assertTrue(output.startswith("hello mesh from "))
+
+    def test_falls_back_when_no_daemon_is_running(self):
+        """Test that the command runs in-process when nothing listens on the socket."""
+        with mock.patch.dict(os.environ, {"XBOT_DAEMON": ""}):
+            self.assertEqual(self.forward("hello", "mesh"), (None, ""))
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_local_commands_are_not_forwarded(self):
+        """Test that interactive and server commands always run in-process."""
+        self.start_server()
+        self.assertEqual(self.forward("--stats", "config"), (None, ""))
+        self.assertEqual(self.forward("node", "apply", "-f", "nodes.yaml"), (None, ""))
+
+    def test_invalidation_is_handled_before_later_commands(self):
+        """Test that the daemon drops its caches before serving the next command."""
+        on_invalidate = mock.Mock()
+        self.start_server(on_invalidate)
+        daemon.invalidate_daemon()
+        self.assertEqual(self.forward("fail", "0"), (0, "failing\n"))
+        on_invalidate.assert_called_once_with()
+
+    def test_invalidation_without_a_daemon_is_ignored(self):
+        """Test that invalidating when no daemon is running neither fails nor starts one."""
+        with mock.patch.object(daemon, "start_daemon") as start_daemon:
+            daemon.invalidate_daemon()
+        start_daemon.assert_not_called()
+
+    def test_daemon_exits_when_idle(self):
+        """Test that serve returns and removes its socket after the idle timeout."""
+        server = threading.Thread(
+            target=daemon.serve, args=(cli, self.socket_path, 0.2), daemon=True
+        )
+        server.start()
+        server.join(5)
+        self.assertFalse(server.is_alive())
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import io
+import os
+import stat
+import tempfile
+import time
+import unittest
+
+from unittest import mock
+
+import requests
+
+from xbot.xbot_commands import util_functions
+
+URL = "http://localhost:3000/nodes"
+BODY = b'[{"id": "a", "name": "ingest-orders"}, {"id": "b", "name": "serve-orders"}]'
+
+
+def make_response(status_code: int, body: bytes = b"", etag: str = None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(body)
+    if etag:
+        response.headers["ETag"] = etag
+    return response
+
+
+class EtagTestCase(unittest.TestCase):
+    def setUp(self):
+        old_cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp())
+        self.addCleanup(os.chdir, old_cwd)
+        for target, value in [
+            ("retrieve_access_token", mock.Mock(return_value="token")),
+            ("response_cache_ttl", 0),
+        ]:
+            patcher = mock.patch.object(util_functions, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        util_functions.reset_transfer_stats()
+        self.path = util_functions.etag_path(URL, "token")
+
+    def get(self, *responses):
+        """Patches the session to answer with `responses` in turn."""
+        patcher = mock.patch.object(
+            util_functions.session, "get", side_effect=list(responses)
+        )
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+
+class TestRevalidation(EtagTestCase):
+    def test_not_modified_is_answered_from_the_stored_body(self):
+        """Test that a 304 reuses the body stored with the ETag it validated."""
+        get = self.get(make_response(200, BODY, '"v1"'), make_response(304))
+        first = util_functions.request_data(URL)
+        self.assertEqual(first.content, BODY)
+        second = util_functions.request_data(URL)
+        self.assertEqual(get.call_args.kwargs["headers"]["If-None-Match"], '"v1"')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(util_functions.transfer_stats["not_modified"], 1)
+        self.assertEqual(util_functions.transfer_stats["reused_bytes"], len(BODY))
+
+    def test_streamed_not_modified_yields_the_stored_rows(self):
+        """Test that stream_data decodes the stored body on a 304."""
+        self.get(make_response(200, BODY, '"v1"'), make_response(304))
+        first = list(util_functions.stream_data(URL))
+        self.assertEqual(list(util_functions.stream_data(URL)), first)
+        self.assertEqual([row["id"] for row in first], ["a", "b"])
+
+    def test_partly_read_stream_is_not_stored(self):
+        """Test that a listing cut short doesn't replace the stored body."""
+        self.get(make_response(200, BODY, '"v1"'), make_response(200, BODY, '"v1"'))
+        rows = util_functions.stream_data(URL)
+        next(rows)
+        rows.close()
+        self.assertEqual(util_functions.load_etag(self.path), (None, None))
+        self.assertEqual(os.listdir(util_functions.ETAG_CACHE_DIR), [])
+        list(util_functions.stream_data(URL))
+        self.assertEqual(util_functions.load_etag(self.path), ('"v1"', BODY))
+
+    def test_stored_bodies_are_only_readable_by_their_owner(self):
+        """Test that the store is private, like config.json."""
+        util_functions.store_etag(self.path, '"v1"', BODY)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        directory = stat.S_IMODE(os.stat(util_functions.ETAG_CACHE_DIR).st_mode)
+        self.assertEqual(directory & 0o077, 0)
+
+
+class TestPruning(EtagTestCase):
+    def store(self, name: str, age: float) -> str:
+        path = os.path.join(util_functions.ETAG_CACHE_DIR, name)
+        util_functions.store_etag(path, '"v1"', BODY)
+        then = time.time() - age
+        os.utime(path, (then, then))
+        return path
+
+    def test_least_recently_used_bodies_go_first(self):
+        """Test that the oldest bodies are removed until the store fits its cap."""
+        paths = [self.store(name, age) for name, age in [("a", 30), ("b", 20)]]
+        newest = self.store("c", 10)
+        util_functions.prune_etags(max_bytes=2 * os.path.getsize(newest))
+        self.assertEqual(sorted(os.listdir(util_functions.ETAG_CACHE_DIR)), ["b", "c"])
+        self.assertFalse(os.path.exists(paths[0]))
+
+    def test_stale_bodies_are_removed(self):
+        """Test that bodies unused for longer than the maximum age are removed."""
+        self.store("old", 3600)
+        self.store("new", 0)
+        util_functions.prune_etags(max_age=60)
+        self.assertEqual(os.listdir(util_functions.ETAG_CACHE_DIR), ["new"])
+
+
+class TestTransferStats(unittest.TestCase):
+    def setUp(self):
+        util_functions.reset_transfer_stats()
+
+    def test_record_transfer_sums_wire_and_decoded_bytes(self):
+        """Test that compressed and decompressed sizes are counted separately."""
+        response = make_response(200, b"x" * 40)
+        response.raw.read()
+        util_functions.record_transfer(response, 100)
+        util_functions.record_transfer(make_response(304), reused_body=b"y" * 7)
+        self.assertEqual(
+            util_functions.transfer_stats,
+            {
+                "requests": 2,
+                "not_modified": 1,
+                "cached": 0,
+                "wire_bytes": 40,
+                "decoded_bytes": 100,
+                "reused_bytes": 7,
+            },
+        )
+        self.assertEqual(util_functions.format_bytes(2500000), "2.5 MB")
+
+
+if __name__ == "__main__":
+    unittest.main()
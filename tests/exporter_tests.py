@@ -0,0 +1,125 @@
+import json
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+import requests
+
+from xbot.xbot_commands import util_functions
+from xbot.xbot_commands.exporter import Snapshot, render
+
+CONFIG = {
+    "output_format": "default",
+    "profiles": {
+        "eu": {"base_url": "http://eu.example:3000", "access_token": "eu-token"},
+        "us": {"base_url": "http://us.example:3000", "access_token": "us-token"},
+    },
+}
+
+FAMILIES = [
+    ("xbot_ports", "Ports by state.", [({"profile": "eu", "state": "open"}, 4)]),
+    ("xbot_up", "Up.", [({}, 1)]),
+]
+
+
+class TestExporter(unittest.TestCase):
+    def test_render_writes_help_type_and_labels(self):
+        """Test that families are rendered as gauges in the text format."""
+        text = render(FAMILIES)
+        self.assertIn("# TYPE xbot_ports gauge\n", text)
+        self.assertIn('xbot_ports{profile="eu",state="open"} 4\n', text)
+        self.assertIn("xbot_up 1\n", text)
+
+    def test_label_values_are_escaped(self):
+        """Test that quotes and backslashes can't break the exposition format."""
+        text = render([("m", "h", [({"name": 'a"b\\c'}, 1)])])
+        self.assertIn('m{name="a\\"b\\\\c"} 1', text)
+
+    def test_failed_refresh_keeps_the_last_counts(self):
+        """Test that scrapes keep the previous snapshot when the API fails."""
+        snapshot = Snapshot()
+        self.assertTrue(snapshot.refresh(lambda: FAMILIES))
+
+        def fail():
+            raise OSError("API unreachable")
+
+        self.assertFalse(snapshot.refresh(fail))
+        self.assertIn('xbot_ports{profile="eu",state="open"} 4', snapshot.text)
+        self.assertIn("xbot_exporter_last_refresh_success 0", snapshot.text)
+
+
+def fake_api(down: set):
+    """Answers aggregate GETs and count HEADs, failing for the hosts in `down`."""
+
+    def request(url, headers=None, timeout=None):
+        if any(host in url for host in down):
+            raise requests.ConnectionError(f"{url} is unreachable")
+        response = requests.Response()
+        response.status_code = 200
+        if "/nodes?select=" in url:
+            rows = [{"node_state": "active", "node_type": "operational", "count": 3}]
+        elif "/ports?select=" in url:
+            rows = [{"port_state": "open", "count": 4}]
+        else:
+            rows = []
+            response.headers["Content-Range"] = "0-0/2"
+        response._content = json.dumps(rows).encode()
+        return response
+
+    return request
+
+
+class TestMeshMetrics(unittest.TestCase):
+    def setUp(self):
+        old_cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp())
+        self.addCleanup(os.chdir, old_cwd)
+        with open("config.json", "w") as outfile:
+            json.dump(CONFIG, outfile)
+        self.down = set()
+        for method in ["get", "head"]:
+            patcher = mock.patch.object(
+                util_functions.session, method, side_effect=fake_api(self.down)
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        last_results = {}
+        self.collect = lambda: util_functions.collect_mesh_metrics(
+            [], [], [], ["eu", "us"], last_results
+        )
+
+    def test_unreachable_api_keeps_the_last_counts(self):
+        """Test that a refresh with no answer from any profile fails as a whole."""
+        snapshot = Snapshot()
+        self.assertTrue(snapshot.refresh(self.collect))
+        refreshed_at = snapshot.refreshed_at
+        self.down.update(["eu.example", "us.example"])
+        with self.assertLogs(level="ERROR"):
+            self.assertFalse(snapshot.refresh(self.collect))
+        self.assertIn(
+            'xbot_nodes{profile="eu",state="active",type="operational"} 3',
+            snapshot.text,
+        )
+        self.assertIn('xbot_ports{profile="us",state="open"} 4', snapshot.text)
+        self.assertIn("xbot_exporter_last_refresh_success 0", snapshot.text)
+        self.assertEqual(snapshot.refreshed_at, refreshed_at)
+
+    def test_unreachable_profile_keeps_its_last_counts(self):
+        """Test that one failing profile is down but still exported."""
+        snapshot = Snapshot()
+        snapshot.refresh(self.collect)
+        self.down.add("us.example")
+        with self.assertLogs(level="ERROR"):
+            self.assertTrue(snapshot.refresh(self.collect))
+        self.assertIn('xbot_up{profile="eu"} 1', snapshot.text)
+        self.assertIn('xbot_up{profile="us"} 0', snapshot.text)
+        self.assertIn('xbot_ports{profile="us",state="open"} 4', snapshot.text)
+        self.assertIn(
+            'xbot_nodes_created_within_days{profile="us",days="7"} 2', snapshot.text
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
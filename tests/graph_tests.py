@@ -0,0 +1,55 @@
+import unittest
+
+from xbot.xbot_commands.graph import MeshGraph
+
+EDGES = [("a", "b"), ("b", "c"), ("b", "d"), ("d", "e"), ("a", "b"), ("c", "c")]
+
+
+class TestMeshGraph(unittest.TestCase):
+    def test_duplicate_edges_and_self_loops_are_dropped(self):
+        """Test that the CSR holds each distinct edge once."""
+        graph = MeshGraph(EDGES)
+        self.assertEqual(graph.edge_count, 4)
+        self.assertEqual(graph.fan_out(graph.index["b"]), 2)
+        self.assertEqual(graph.fan_in(graph.index["b"]), 1)
+
+    def test_bfs_lists_reachable_nodes_nearest_first(self):
+        """Test that traversals report depth and parent in both directions."""
+        graph = MeshGraph(EDGES)
+        reached = graph.bfs("a")
+        self.assertEqual([id for id, _, _ in reached][:1], ["b"])
+        self.assertIn(("e", 3, "d"), reached)
+        self.assertEqual(graph.bfs("e", upstream=True)[-1], ("a", 3, "b"))
+        self.assertEqual(graph.bfs("missing"), [])
+
+    def test_shortest_path_follows_lineage_downstream(self):
+        """Test that paths only go from ancestor to descendant."""
+        graph = MeshGraph(EDGES)
+        self.assertEqual(graph.shortest_path("a", "e"), ["a", "b", "d", "e"])
+        self.assertEqual(graph.shortest_path("e", "a"), [])
+
+    def test_stats_report_cycles_and_longest_chain(self):
+        """Test that nodes on a cycle are left out of the topological order."""
+        stats = MeshGraph(EDGES + [("e", "x"), ("x", "y"), ("y", "x")]).stats(top=1)
+        self.assertEqual(stats["nodes_on_cycles"], 2)
+        self.assertEqual(stats["longest_chain"], 3)
+        self.assertEqual(stats["sources"], 1)
+        self.assertEqual(stats["top_fan_out"], [("b", 2)])
+
+    def test_nodes_downstream_of_a_cycle_are_not_on_it(self):
+        """Test that only strongly connected nodes are counted as on a cycle."""
+        graph = MeshGraph([("a", "b"), ("b", "a"), ("b", "c"), ("c", "d")])
+        stats = graph.stats()
+        self.assertEqual((stats["cycles"], stats["nodes_on_cycles"]), (1, 2))
+        self.assertEqual(len(graph.topological_order()[0]), 0)
+
+    def test_blocked_nodes_are_reached_but_not_traversed(self):
+        """Test that a node with a second, unblocked path is still reached."""
+        graph = MeshGraph(EDGES + [("a", "e")])
+        self.assertEqual(
+            {id for id, _, _ in graph.bfs("a", blocked={"b", "a"})}, {"b", "e"}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import io
+import json
+import unittest
+
+from unittest import mock
+
+from click.testing import CliRunner
+from rich.console import Console
+
+from xbot.xbot_commands import commands, util_functions
+
+NODE = {
+    "id": "a",
+    "name": "ingest-orders",
+    "node_state": "active",
+    "node_type": "operational",
+    "node_category": "ingest",
+    "date_created": "2022-01-01T10:00:00.123456+00:00",
+}
+PORT = {
+    "node_id": "a",
+    "port_number": 3000,
+    "name": "orders-in",
+    "port_state": "active",
+    "description": "incoming orders",
+}
+INTERFACE = {
+    "id": "i",
+    "interface_sub_scheme": "kafka",
+    "port_number": 3000,
+    "node_id": "a",
+}
+
+
+class InspectTestCase(unittest.TestCase):
+    def setUp(self):
+        self.output = io.StringIO()
+        self.requests = []
+
+        def fake_stream_data(request_url: str):
+            self.requests.append(request_url)
+            ids = request_url.split("id=in.(")[1].rstrip(")").split(",")
+            for id in ids:
+                yield {**NODE, "id": id, "ports": [], "interfaces": []}
+
+        console = Console(file=self.output, width=200)
+        for target, value in [
+            ("stream_data", fake_stream_data),
+            ("retrieve_output_format", mock.Mock(return_value="default")),
+            ("api_base_url", mock.Mock(return_value="http://localhost:3000")),
+            ("console", console),
+        ]:
+            patcher = mock.patch.object(util_functions, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TestInspectNodes(InspectTestCase):
+    def test_ids_are_requested_in_chunks(self):
+        """Test that nodes are fetched with their ports and interfaces, a chunk per request."""
+        with mock.patch.object(util_functions, "INSPECT_CHUNK_SIZE", 2):
+            nodes = list(util_functions.inspect_nodes(["a", "b", "c", "d", "e"]))
+        self.assertEqual([node["id"] for node in nodes], ["a", "b", "c", "d", "e"])
+        self.assertEqual(
+            self.requests,
+            [
+                "http://localhost:3000/nodes?select=*,ports(*),interfaces(*)&id=in.(a,b)",
+                "http://localhost:3000/nodes?select=*,ports(*),interfaces(*)&id=in.(c,d)",
+                "http://localhost:3000/nodes?select=*,ports(*),interfaces(*)&id=in.(e)",
+            ],
+        )
+
+
+class TestPrintTopology(InspectTestCase):
+    def test_json_lines_hold_each_node_with_its_topology(self):
+        """Test that --json prints one node per line, ports and interfaces included."""
+        node = {**NODE, "ports": [PORT], "interfaces": [INTERFACE]}
+        printed = util_functions.print_topology([node, {**NODE, "id": "b"}], json=True)
+        self.assertEqual(printed, ["a", "b"])
+        rows = [json.loads(line) for line in self.output.getvalue().splitlines()]
+        self.assertEqual(rows[0], node)
+        self.assertEqual(rows[1]["id"], "b")
+
+    def test_ports_and_interfaces_are_listed_under_their_node(self):
+        """Test that a node's ports and interfaces are printed as tables."""
+        node = {**NODE, "ports": [PORT], "interfaces": [INTERFACE]}
+        util_functions.print_topology([node])
+        output = self.output.getvalue()
+        self.assertIn("ingest-orders", output)
+        self.assertIn("orders-in", output)
+        self.assertIn("kafka", output)
+        self.assertNotIn("no ports", output)
+        self.assertNotIn("no interfaces", output)
+
+    def test_nodes_without_ports_or_interfaces_say_so(self):
+        """Test that empty or missing topology is reported instead of an empty table."""
+        util_functions.print_topology(
+            [{**NODE, "ports": [], "interfaces": None}, {**NODE, "id": "b"}]
+        )
+        output = self.output.getvalue()
+        self.assertEqual(output.count("This node has no ports."), 2)
+        self.assertEqual(output.count("This node has no interfaces."), 2)
+
+
+class TestInspectCommand(unittest.TestCase):
+    def test_unknown_ids_are_reported(self):
+        """Test that IDs without a node are listed once, after the found nodes."""
+        with mock.patch.object(commands, "use_profile"), mock.patch.object(
+            commands, "inspect_nodes", return_value=iter([])
+        ) as inspect_nodes, mock.patch.object(
+            commands, "print_topology", return_value=["a"]
+        ), mock.patch.object(
+            commands, "console", Console(width=200)
+        ):
+            result = CliRunner().invoke(commands.inspect, ["a", "nope", "a", "gone"])
+        self.assertEqual(result.exit_code, 0)
+        inspect_nodes.assert_called_once_with(["a", "nope", "gone"])
+        self.assertEqual(result.output, "No nodes found with ID: nope, gone\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
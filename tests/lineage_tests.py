@@ -0,0 +1,122 @@
+import io
+import json
+import unittest
+
+from unittest import mock
+from urllib.parse import unquote
+
+from rich.console import Console
+
+from xbot.xbot_commands import util_functions
+
+NAMES = {"r1": "ingest-orders", "r2": "ingest-users", "s": "serve-shared"}
+LINEAGE = {
+    "r1": [("s", "serve-shared"), ("a", "serve-orders"), ("s", "serve-shared")],
+    "r2": [("s", "serve-shared"), ("b", "serve-users"), ("r2", "ingest-users")],
+}
+
+
+def fake_stream_data(request_url: str):
+    """Answers lineage and name lookups for the roots in LINEAGE."""
+    ids = unquote(request_url).split("in.(")[1].rstrip(")").split(",")
+    if "/ancestor_nodes?" in request_url:
+        for root in ids:
+            for node_id, name in LINEAGE.get(root, []):
+                yield {
+                    "root_node_id": root,
+                    "descendant_node_id": node_id,
+                    "descendant_node_name": name,
+                    "descendant_node_category": "serve",
+                }
+    else:
+        for id in ids:
+            if id in NAMES:
+                yield {"id": id, "name": NAMES[id]}
+
+
+class TestPrintLineage(unittest.TestCase):
+    def setUp(self):
+        self.output = io.StringIO()
+        console = Console(file=self.output, width=200)
+        for target, value in [
+            ("stream_data", fake_stream_data),
+            ("retrieve_output_format", mock.Mock(return_value="default")),
+            ("api_base_url", mock.Mock(return_value="http://localhost:3000")),
+            ("retrieve_access_token", mock.Mock(return_value="token")),
+            ("console", console),
+            ("print", console.print),
+        ]:
+            patcher = mock.patch.object(util_functions, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_shared_nodes_are_listed_once_with_their_roots(self):
+        """Test that a node below several roots is a single row naming each root."""
+        missing = util_functions.print_lineage(["r1", "r2"], "descendant")
+        self.assertEqual(missing, [])
+        lines = self.output.getvalue().splitlines()
+        shared = [line for line in lines if "serve-shared" in line]
+        self.assertEqual(len(shared), 1)
+        self.assertIn("ingest-orders, ingest-users", shared[0])
+        self.assertEqual(sum("serve-" in line for line in lines), 3)
+        self.assertFalse(any(": ingest-users" in line for line in lines))
+
+    def test_json_lines_hold_each_node_once(self):
+        """Test that NDJSON output has one line per distinct node."""
+        util_functions.print_lineage(["r1", "r2"], "descendant", json=True)
+        rows = [json.loads(line) for line in self.output.getvalue().splitlines()]
+        self.assertEqual(
+            sorted(row["descendant_node_id"] for row in rows), ["a", "b", "s"]
+        )
+        self.assertTrue(all(row["root_node_name"] for row in rows))
+
+    def test_tree_marks_nodes_already_shown(self):
+        """Test that the per-root tree marks a shared node under its second root."""
+        util_functions.print_lineage(["r1", "r2"], "descendant", tree=True)
+        self.assertEqual(self.output.getvalue().count("serve-shared (shared)"), 1)
+
+    def test_unknown_ids_are_reported_as_missing(self):
+        """Test that IDs without a node are returned for the caller to report."""
+        missing = util_functions.print_lineage(["r1", "nope"], "descendant")
+        self.assertEqual(missing, ["nope"])
+        self.assertIn("serve-orders", self.output.getvalue())
+
+    def test_known_names_are_not_looked_up_again(self):
+        """Test that names passed in, e.g. from --from-ls, count as found."""
+        missing = util_functions.print_lineage(
+            ["r1", "x"], "descendant", names={"x": "from-ls"}
+        )
+        self.assertEqual(missing, [])
+
+
+class TestLineageCache(unittest.TestCase):
+    def setUp(self):
+        for target, value in [
+            ("stream_data", mock.Mock(side_effect=fake_stream_data)),
+            ("api_base_url", mock.Mock(return_value="http://localhost:3000")),
+            ("retrieve_access_token", mock.Mock(return_value="token")),
+        ]:
+            patcher = mock.patch.object(util_functions, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(util_functions.enable_response_cache, 0)
+
+    def test_lineage_is_reused_while_the_response_cache_is_enabled(self):
+        """Test that xbotd answers a repeated lineage request from memory."""
+        util_functions.enable_response_cache(30)
+        first = list(util_functions.fetch_lineage(["r1", "r2"]))
+        self.assertEqual(list(util_functions.fetch_lineage(["r1", "r2"])), first)
+        self.assertEqual(util_functions.stream_data.call_count, 1)
+        util_functions.clear_response_cache()
+        list(util_functions.fetch_lineage(["r1", "r2"]))
+        self.assertEqual(util_functions.stream_data.call_count, 2)
+
+    def test_lineage_is_fetched_each_time_without_the_cache(self):
+        """Test that a CLI process, which has no response cache, keeps nothing."""
+        list(util_functions.fetch_lineage(["r1"]))
+        list(util_functions.fetch_lineage(["r1"]))
+        self.assertEqual(util_functions.stream_data.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from xbot.xbot_commands.name_index import NameIndex, edit_distance, trigrams
+
+NAMES = {
+    "a1": "ingest-orders",
+    "b2": "ingest-customers",
+    "c3": "serve-orders",
+    "d4": "enrich-billing",
+}
+
+
+class TestNameIndex(unittest.TestCase):
+    def test_trigrams_are_padded_per_word(self):
+        """Test that trigrams match pg_trgm's padding."""
+        self.assertEqual(trigrams("Ab-c"), {"  a", " ab", "ab ", "  c", " c "})
+
+    def test_edit_distance_counts_transpositions_once(self):
+        """Test that swapped letters are a single typo."""
+        self.assertEqual(edit_distance("ingset", "ingest", 2), 1)
+        self.assertEqual(edit_distance("abc", "xyzabc", 2), 3)
+
+    def test_search_tolerates_typos(self):
+        """Test that a misspelt name still ranks the right item first."""
+        index = NameIndex(NAMES)
+        self.assertEqual(index.search("ingset-ordres")[0][0], "a1")
+        self.assertEqual(index.search("custmers")[0][0], "b2")
+
+    def test_search_ranks_prefix_matches_first(self):
+        """Test that names starting with the query outrank other matches."""
+        index = NameIndex(NAMES)
+        keys = [key for key, _ in index.search("ingest")]
+        self.assertEqual(sorted(keys[:2]), ["a1", "b2"])
+
+    def test_complete_matches_names_and_ids(self):
+        """Test that completion matches both name and ID prefixes."""
+        index = NameIndex(NAMES)
+        self.assertEqual(sorted(index.complete("ingest-")), ["a1", "b2"])
+        self.assertEqual(index.complete("c"), ["c3"])
+
+    def test_sync_updates_only_changes(self):
+        """Test that syncing adds, renames and removes items in place."""
+        index = NameIndex(NAMES)
+        index.sorted_names, index.trigram_index, index.sorted_keys
+        names = dict(NAMES, e5="serve-billing", a1="ingest-invoices")
+        del names["d4"]
+        self.assertEqual(index.sync(names), (2, 1))
+        self.assertEqual(index.complete("ingest-i"), ["a1"])
+        self.assertEqual(index.complete("enrich"), [])
+        self.assertEqual(index.search("serve-biling")[0][0], "e5")
+        self.assertEqual(index.sorted_keys, ["a1", "b2", "c3", "e5"])
+        self.assertEqual(index.sorted_names, NameIndex(names).sorted_names)
+
+    def test_stored_index_keeps_its_sorted_lists(self):
+        """Test that a loaded index completes without sorting the names again."""
+        data = NameIndex(NAMES, 1.0).to_dict()
+        index = NameIndex.from_dict(data)
+        self.assertIs(index._sorted_names, data["sorted_names"])
+        self.assertEqual(index.complete("SERVE"), ["c3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
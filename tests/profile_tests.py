@@ -0,0 +1,215 @@
+import json
+import os
+import stat
+import tempfile
+import threading
+import unittest
+
+from functools import partial
+from unittest import mock
+
+import click
+import requests
+
+from xbot.xbot_commands import util_functions
+
+CONFIG = {
+    "access_token": "top-level-token",
+    "output_format": "default",
+    "default_profile": "eu",
+    "profiles": {
+        "eu": {"base_url": "http://eu.example:3000", "access_token": "eu-token"},
+        "us": {"base_url": "http://us.example:3000", "access_token": "us-token"},
+    },
+}
+
+
+class Response:
+    def __init__(self, status_code: int, items: list = ()):
+        self.status_code = status_code
+        self.items = list(items)
+
+    def json(self):
+        return self.items
+
+
+class ProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        old_cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp())
+        self.addCleanup(os.chdir, old_cwd)
+        self.write_config(CONFIG)
+        util_functions.use_profile(None)
+        self.addCleanup(util_functions.use_profile, None)
+        patcher = mock.patch.dict(os.environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        os.environ.pop("XBOT_PROFILE", None)
+
+    def write_config(self, config: dict):
+        with open("config.json", "w") as outfile:
+            json.dump(config, outfile)
+
+
+class TestProfileSelection(ProfileTestCase):
+    def test_default_profile_from_config(self):
+        """Test that the config's default profile is used when none is selected."""
+        self.assertEqual(util_functions.active_profile_name(), "eu")
+        self.assertEqual(util_functions.retrieve_access_token(), "eu-token")
+
+    def test_environment_overrides_default_profile(self):
+        """Test that XBOT_PROFILE takes precedence over the config's default."""
+        os.environ["XBOT_PROFILE"] = "us"
+        self.assertEqual(util_functions.api_base_url(), "http://us.example:3000")
+
+    def test_selected_profile_overrides_environment(self):
+        """Test that use_profile takes precedence over XBOT_PROFILE."""
+        os.environ["XBOT_PROFILE"] = "eu"
+        util_functions.use_profile("us")
+        self.assertEqual(
+            util_functions.retrieve_profile(),
+            {"base_url": "http://us.example:3000", "access_token": "us-token"},
+        )
+
+    def test_unknown_profile_is_a_usage_error(self):
+        """Test that selecting a profile missing from the config is refused."""
+        with self.assertRaises(click.UsageError):
+            util_functions.use_profile("apac")
+
+    def test_top_level_login_without_profiles(self):
+        """Test that a config without profiles keeps using the top-level login."""
+        self.write_config({"access_token": "token", "output_format": "default"})
+        self.assertEqual(util_functions.list_profiles(), ["default"])
+        self.assertEqual(
+            util_functions.retrieve_profile(),
+            {"base_url": util_functions.DEFAULT_BASE_URL, "access_token": "token"},
+        )
+
+
+class TestFanOut(ProfileTestCase):
+    def test_each_profile_is_queried_with_its_own_login(self):
+        """Test that every worker thread talks to its own profile."""
+        responses = util_functions.fan_out(util_functions.retrieve_access_token)
+        self.assertEqual(responses, {"eu": "eu-token", "us": "us-token"})
+
+    def test_failed_profile_does_not_stop_the_others(self):
+        """Test that a profile whose request raises is reported as None."""
+
+        def fetch():
+            if util_functions.active_profile_name() == "us":
+                raise OSError("connection refused")
+            return threading.current_thread().name
+
+        with self.assertLogs(level="ERROR") as logs:
+            responses = util_functions.fan_out(fetch)
+        self.assertIsNone(responses["us"])
+        self.assertIsNotNone(responses["eu"])
+        self.assertIn("us: connection refused", logs.output[0])
+
+    def test_unreachable_profile_is_reported_by_fan_out(self):
+        """Test that a network error reaches fan_out instead of the login hint."""
+
+        def get(url, **kwargs):
+            if url.startswith("http://us.example"):
+                raise requests.ConnectionError("connection refused")
+            response = requests.Response()
+            response.status_code = 200
+            response._content = b'[{"id": "a"}]'
+            return response
+
+        with mock.patch.object(
+            util_functions.session, "get", side_effect=get
+        ), mock.patch.object(
+            util_functions, "load_etag", return_value=(None, None)
+        ), mock.patch.object(
+            util_functions, "record_transfer"
+        ), mock.patch.object(
+            util_functions, "console"
+        ) as console, self.assertLogs(
+            level="ERROR"
+        ) as logs:
+            responses = util_functions.fan_out(partial(util_functions.list_all, "node"))
+        self.assertIsNone(responses["us"])
+        self.assertEqual(responses["eu"].json(), [{"id": "a"}])
+        self.assertIn("us: connection refused", logs.output[-1])
+        console.print.assert_not_called()
+
+    def test_unreachable_api_is_not_reported_as_a_login_problem(self):
+        """Test that outside fan_out a network error prints which API was unreachable."""
+        with mock.patch.object(
+            util_functions.session,
+            "get",
+            side_effect=requests.ConnectionError("connection refused"),
+        ), mock.patch.object(
+            util_functions, "load_etag", return_value=(None, None)
+        ), mock.patch.object(
+            util_functions, "console"
+        ) as console, self.assertLogs(
+            level="ERROR"
+        ):
+            self.assertIsNone(util_functions.list_all("node"))
+        message = console.print.call_args[0][0]
+        self.assertIn("http://eu.example:3000", message)
+        self.assertNotIn("logged in", message)
+
+    def test_merge_tags_items_and_skips_failed_profiles(self):
+        """Test that merged items carry their profile and failures are reported."""
+        responses = {
+            "eu": Response(200, [{"id": "a"}]),
+            "us": Response(500),
+            "apac": None,
+            "local": [{"id": "b"}],
+        }
+        with mock.patch.object(util_functions, "console") as console:
+            merged = util_functions.merge_profile_results(responses)
+        self.assertEqual(
+            merged, [{"profile": "eu", "id": "a"}, {"profile": "local", "id": "b"}]
+        )
+        self.assertIn("us, apac", console.print.call_args[0][0])
+
+
+class TestStoreAccessToken(ProfileTestCase):
+    def store(self, **kwargs):
+        with mock.patch.object(
+            util_functions, "generate_access_token", return_value="new-token"
+        ) as generate:
+            util_functions.store_access_token(
+                "me@example.com", "secret", False, **kwargs
+            )
+        return generate
+
+    def test_new_profile_is_merged_into_the_config(self):
+        """Test that logging in to a profile keeps the other profiles and default."""
+        generate = self.store(profile="apac", base_url="http://apac.example:3000")
+        generate.assert_called_once_with(
+            "me@example.com", "secret", "http://apac.example:3000"
+        )
+        config = util_functions.read_config()
+        self.assertEqual(config["default_profile"], "eu")
+        self.assertEqual(config["profiles"]["us"], CONFIG["profiles"]["us"])
+        self.assertEqual(
+            config["profiles"]["apac"],
+            {"base_url": "http://apac.example:3000", "access_token": "new-token"},
+        )
+
+    def test_existing_profile_keeps_its_url(self):
+        """Test that refreshing a profile's token without a URL keeps the stored one."""
+        self.store(profile="us")
+        config = util_functions.read_config()
+        self.assertEqual(
+            config["profiles"]["us"],
+            {"base_url": "http://us.example:3000", "access_token": "new-token"},
+        )
+        self.assertEqual(config["access_token"], "top-level-token")
+
+    def test_config_is_only_readable_by_its_owner(self):
+        """Test that the stored tokens are written with owner-only permissions."""
+        os.remove("config.json")
+        self.store()
+        mode = stat.S_IMODE(os.stat("config.json").st_mode)
+        self.assertEqual(mode, 0o600)
+        self.assertEqual(util_functions.read_config()["access_token"], "new-token")
+
+
+if __name__ == "__main__":
+    unittest.main()
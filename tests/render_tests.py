@@ -0,0 +1,34 @@
+import io
+import unittest
+
+from xbot.xbot_commands.render import column_widths, render_plain
+
+HEADERS = ["Name", "State"]
+ROWS = [("ingest-orders", "active"), ("serve", "error")]
+
+
+class TestRenderPlain(unittest.TestCase):
+    def test_columns_are_sized_from_headers_and_rows(self):
+        """Test that each column fits its widest value."""
+        self.assertEqual(column_widths(HEADERS, ROWS), [13, 6])
+
+    def test_rows_are_written_fixed_width(self):
+        """Test that every row lines up under the headers."""
+        output = io.StringIO()
+        self.assertEqual(render_plain(output, "Results", HEADERS, iter(ROWS)), 2)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "Results")
+        self.assertEqual(lines[1], "Name           State")
+        self.assertEqual(lines[3], "ingest-orders  active")
+        self.assertEqual(lines[4], "serve          error")
+
+    def test_rows_after_the_sample_are_written_in_full(self):
+        """Test that values wider than the sampled width aren't cut."""
+        output = io.StringIO()
+        rows = ROWS + [("a-much-longer-node-name", "active")]
+        render_plain(output, "Results", HEADERS, rows, sample_rows=2, chunk_rows=1)
+        self.assertIn("a-much-longer-node-name  active", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import datetime
+import unittest
+
+from xbot.xbot_commands.where import (
+    WhereSyntaxError,
+    compile_where,
+    order_query,
+    parse,
+    parse_sort,
+    top_n,
+)
+
+NOW = datetime.datetime(2022, 2, 1, tzinfo=datetime.timezone.utc)
+
+
+class TestWhereExpressions(unittest.TestCase):
+    def test_parse_expands_short_field_names(self):
+        """Test that state and type expand to the target item's columns."""
+        tree = parse("state=active and type=operational", "port")
+        self.assertEqual(
+            tree,
+            (
+                "and",
+                [
+                    ("cmp", None, "port_state", "=", "active"),
+                    ("cmp", None, "port_type", "=", "operational"),
+                ],
+            ),
+        )
+
+    def test_parse_flattens_nested_groups(self):
+        """Test that parenthesised conjunctions are merged into their parent."""
+        tree = parse("(a=1 and b=2) and c=3")
+        self.assertEqual(len(tree[1]), 3)
+
+    def test_compile_pushes_down_supported_filters(self):
+        """Test that supported operators compile to a single and= parameter."""
+        query, predicate = compile_where(
+            "state in (active,error) and age<7 and name~'ingest'", "node", NOW
+        )
+        self.assertIsNone(predicate)
+        self.assertEqual(
+            query,
+            "select=*&and=(node_state.in.(active,error),"
+            "date_created.gt.2022-01-25T00:00:00%2B00:00,name.ilike.*ingest*)",
+        )
+
+    def test_compile_or_and_not(self):
+        """Test that or and not are kept in the PostgREST logic tree."""
+        query, _ = compile_where("not (state=active or name!~core)", "node", NOW)
+        self.assertEqual(
+            query, "select=*&and=(not.or(node_state.eq.active,name.not.ilike.*core*))"
+        )
+
+    def test_double_negation_cancels_out(self):
+        """Test that a not of a not compiles to the inner filter."""
+        for expression in ["not not state=active", "not (not state=active)"]:
+            query, predicate = compile_where(expression, "node", NOW)
+            self.assertIsNone(predicate)
+            self.assertEqual(query, "select=*&and=(node_state.eq.active)")
+        query, _ = compile_where("not not not state=active", "node", NOW)
+        self.assertEqual(query, "select=*&and=(node_state.not.eq.active)")
+
+    def test_age_filter_accepts_timestamps_without_fractions(self):
+        """Test that rows whose date_created has no fractional seconds are aged."""
+        _, predicate = compile_where("age=30", "node", NOW)
+        self.assertTrue(predicate({"date_created": "2022-01-01T10:00:00+00:00"}))
+        self.assertTrue(predicate({"date_created": "2022-01-01T10:00:00.5+00:00"}))
+        self.assertFalse(predicate({"date_created": "2022-01-05T10:00:00Z"}))
+
+    def test_compile_quotes_reserved_characters(self):
+        """Test that values containing commas are double-quoted."""
+        query, _ = compile_where("name='a,b'", "node", NOW)
+        self.assertEqual(query, "select=*&and=(name.eq.%22a,b%22)")
+
+    def test_compile_embedded_filter(self):
+        """Test that filters on the parent node use an inner embed."""
+        query, predicate = compile_where(
+            "node.state=error and port_number>3000", "port"
+        )
+        self.assertIsNone(predicate)
+        self.assertEqual(
+            query,
+            "select=*,nodes!inner(*)&nodes.node_state=eq.error&and=(port_number.gt.3000)",
+        )
+
+    def test_unsupported_filters_fall_back_to_predicate(self):
+        """Test that conditions the API can't evaluate are applied client-side."""
+        query, predicate = compile_where("state=active and name=~'^in.*-1$'", "node")
+        self.assertEqual(query, "select=*&and=(node_state.eq.active)")
+        self.assertTrue(predicate({"name": "ingest-1", "node_state": "active"}))
+        self.assertFalse(predicate({"name": "ingest-12", "node_state": "active"}))
+
+    def test_selected_columns_include_those_the_predicate_needs(self):
+        """Test that a narrow select still returns the columns filtered locally."""
+        query, predicate = compile_where(
+            "state=active and age=3", "node", NOW, columns=["id", "name"]
+        )
+        self.assertTrue(query.startswith("select=id,name,date_created&"))
+        query, predicate = compile_where("state=active", "node", NOW, ["id", "name"])
+        self.assertEqual(query, "select=id,name&and=(node_state.eq.active)")
+
+    def test_predicate_evaluates_embedded_or(self):
+        """Test that an or across embedded fields is evaluated on the embedded row."""
+        query, predicate = compile_where(
+            "node.state=error or port_number>=3002", "port"
+        )
+        self.assertEqual(query, "select=*,nodes(*)")
+        self.assertTrue(
+            predicate({"port_number": 3000, "nodes": {"node_state": "error"}})
+        )
+        self.assertTrue(predicate({"port_number": 3002, "nodes": None}))
+        self.assertFalse(
+            predicate({"port_number": 3000, "nodes": {"node_state": "active"}})
+        )
+
+    def test_syntax_errors(self):
+        """Test that malformed expressions raise WhereSyntaxError."""
+        for expression in [
+            "",
+            "state=",
+            "state in (a",
+            "age<soon",
+            "name is maybe",
+            "name=~'('",
+        ]:
+            with self.assertRaises(WhereSyntaxError):
+                compile_where(expression, "node", NOW)
+
+
+class TestOrdering(unittest.TestCase):
+    def test_sort_by_age_orders_date_created_the_other_way(self):
+        """Test that youngest-first means newest date_created first."""
+        ordering = parse_sort("state,age", "node")
+        self.assertEqual(ordering, [("node_state", False), ("date_created", True)])
+        self.assertEqual(
+            order_query(ordering, 10),
+            "order=node_state.asc,date_created.desc&limit=10",
+        )
+
+    def test_top_n_keeps_the_first_rows(self):
+        """Test that top_n matches a full sort truncated to N rows."""
+        items = [{"name": f"node-{i % 7}", "port_number": i} for i in range(50)]
+        ordering = [("name", True), ("port_number", False)]
+        expected = sorted(items, key=lambda item: item["port_number"])
+        expected = sorted(expected, key=lambda item: item["name"], reverse=True)
+        self.assertEqual(top_n(items, ordering, 5), expected[:5])
+
+    def test_top_n_puts_nulls_last_when_ascending(self):
+        """Test that missing values sort like PostgreSQL's default NULLS LAST."""
+        items = [{"name": None}, {"name": "b"}, {"name": "a"}]
+        self.assertEqual(
+            [item["name"] for item in top_n(items, [("name", False)])],
+            ["a", "b", None],
+        )
+        self.assertEqual(
+            [item["name"] for item in top_n(items, [("name", True)])],
+            [None, "b", "a"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
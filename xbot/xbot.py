@@ -1,14 +1,44 @@
+import sys
+
+from xbot_commands.daemon import main
+
+# Hand the command to a running xbotd before the heavier imports below.
+if __name__ == "__main__":
+    sys.exit(main())
+
 import logging
 
 import click
 
-from xbot_commands.commands import ancestors, config, descendants, ls, search, total
+from xbot_commands.commands import (
+    ancestors,
+    apply,
+    config,
+    descendants,
+    exporter,
+    impact,
+    inspect,
+    ls,
+    path,
+    search,
+    stats,
+    total,
+)
+from xbot_commands.util_functions import print_transfer_stats, reset_transfer_stats
 
 
 @click.group()
-def xbot() -> None:
+@click.option(
+    "--stats",
+    is_flag=True,
+    help="report the bytes received, before and after decompression",
+)
+@click.pass_context
+def xbot(ctx: click.Context, stats: bool = False) -> None:
     """Main CLI entrypoint for xbot."""
-    pass
+    reset_transfer_stats()
+    if stats:
+        ctx.call_on_close(print_transfer_stats)
 
 
 @xbot.group()
@@ -29,20 +59,35 @@ def interface() -> None:
     pass
 
 
+@xbot.group()
+def graph() -> None:
+    """Analyse lineage across the whole mesh."""
+    pass
+
+
 xbot.add_command(config)
+xbot.add_command(exporter)
 
 node.add_command(ls)
 node.add_command(total)
 node.add_command(search)
 node.add_command(descendants)
 node.add_command(ancestors)
+node.add_command(inspect)
+node.add_command(apply)
 
 port.add_command(search)
 port.add_command(ls)
 port.add_command(total)
+port.add_command(apply)
 
 interface.add_command(ls)
 interface.add_command(total)
+interface.add_command(apply)
+
+graph.add_command(impact)
+graph.add_command(path)
+graph.add_command(stats)
 
 if __name__ == "__main__":
-    xbot()
+    xbot(prog_name="xbot")
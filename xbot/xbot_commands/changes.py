@@ -0,0 +1,100 @@
+"""Diffs a desired set of items against the mesh and batches the resulting writes.
+
+A manifest lists the items that should exist. Each one is matched to the
+current listing by its key columns, e.g. `id` for nodes or `node_id` and
+`port_number` for ports, or by its name when the key is left out. The plan
+holds the items to create, the items with changed fields to update, and with
+pruning, the keys of current items missing from the manifest to delete.
+
+Creates and updates are both sent as PostgREST bulk upserts. PostgreSQL checks
+an upserted row's NOT NULL columns before it finds the existing row, so an
+update carries the whole current item with the manifest's fields on top. A
+bulk request uses the columns of its first row for every row, so rows are
+grouped by their set of columns before being split into batches.
+"""
+
+
+class ManifestError(ValueError):
+    """Raised when a manifest lists invalid or duplicate items."""
+
+
+def item_key(item: dict, columns: list) -> str:
+    """Joins an item's key column values, e.g. `<node_id>:3000` for a port."""
+    return ":".join(str(item[column]) for column in columns)
+
+
+def plan_changes(
+    desired: list, current: list, columns: list, prune: bool = False
+) -> dict:
+    """Works out the writes that turn the current items into the desired ones.
+
+    Args:
+        desired (list): items from the manifest. Only the fields they list are compared.
+        current (list): items currently in the mesh.
+        columns (list): key columns identifying an item.
+        prune (bool): delete current items that aren't in the manifest.
+
+    Returns:
+        dict: the items to `create` and `update`, the keys to `delete`, and the
+            number of `unchanged` items. Updates are whole items.
+
+    Raises:
+        ManifestError: for an item that isn't a mapping, an item listed twice, or
+            an item without its key whose name is shared by several current items.
+    """
+    current_by_key = {item_key(item, columns): item for item in current}
+    current_by_name = {}
+    for item in current:
+        current_by_name.setdefault(item.get("name"), []).append(item)
+    plan = {"create": [], "update": [], "delete": [], "unchanged": 0}
+    seen = set()
+    for position, item in enumerate(desired, 1):
+        if not isinstance(item, dict):
+            raise ManifestError(f"Item {position} is not a mapping of fields.")
+        if not all(column in item for column in columns):
+            matches = current_by_name.get(item.get("name"), [])
+            if not matches:
+                plan["create"].append(item)
+                continue
+            if len(matches) > 1:
+                raise ManifestError(
+                    f"{item.get('name')!r} is the name of {len(matches)} items, "
+                    f"list its {', '.join(columns)} to pick one."
+                )
+            existing = matches[0]
+            item = {**{column: existing[column] for column in columns}, **item}
+        key = item_key(item, columns)
+        if key in seen:
+            raise ManifestError(f"{key} is listed more than once.")
+        seen.add(key)
+        existing = current_by_key.get(key)
+        if existing is None:
+            plan["create"].append(item)
+        elif any(existing.get(field) != value for field, value in item.items()):
+            plan["update"].append({**existing, **item})
+        else:
+            plan["unchanged"] += 1
+    if prune:
+        plan["delete"] = [key for key in current_by_key if key not in seen]
+    return plan
+
+
+def chunked(items: list, size: int) -> list:
+    """Splits a list into consecutive chunks of at most `size` items."""
+    return [items[start : start + size] for start in range(0, len(items), size)]
+
+
+def upsert_batches(rows: list, size: int) -> list:
+    """Groups rows by their set of columns and splits each group into batches.
+
+    Args:
+        rows (list): the items to create or update.
+        size (int): maximum number of rows per batch.
+
+    Returns:
+        list: batches of rows that all have the same columns.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(frozenset(row), []).append(row)
+    return [batch for group in groups.values() for batch in chunked(group, size)]
@@ -3,61 +3,184 @@ import logging
 import os
 import sys
 
+from functools import partial
+
 import click
 import requests
 
+from click.shell_completion import CompletionItem
 from requests.structures import CaseInsensitiveDict
 from rich import print
 from rich.console import Console
 
+from xbot_commands.changes import ManifestError, plan_changes
+from xbot_commands.exporter import serve_metrics
 from xbot_commands.util_functions import (
-    fetch_lineage,
+    ITEM_KEYS,
+    active_profile_name,
+    apply_changes,
+    collect_mesh_metrics,
+    fan_out,
+    fuzzy_search,
+    inspect_nodes,
+    list_all,
     list_by_item_age,
     list_by_item_state,
     list_by_state_and_age,
     list_by_type_and_age,
     list_by_type_and_state,
+    list_current_items,
+    list_profiles,
+    list_where,
+    load_manifest,
+    load_mesh_graph,
+    load_name_index,
+    merge_profile_results,
+    print_apply_errors,
+    print_error_message,
+    print_graph_path,
+    print_graph_stats,
+    print_impact,
     print_interface_results,
     print_lineage,
+    print_plan,
+    print_results,
     print_search,
-    request_data,
+    print_topology,
     retrieve_access_token,
     search_by_id,
     search_by_interface,
-    search_by_name,
     search_by_type,
     store_access_token,
+    use_profile,
 )
+from xbot_commands.where import WhereSyntaxError, parse, parse_sort, top_n
 
 CLOUD_PROVIDERS = ["aws", "azure", "gcp"]
 ITEM_TYPES = ["operational", "digital-twin", "aggregate"]
 ITEM_STATES = ["provisioned", "started", "active", "error", "stopped", "suspended"]
+ITEM_CATEGORIES = ["source", "ingest", "enrich", "serve"]
+PORT_STATES = ["open", "closed"]
 
 logger = logging.getLogger()
-console = Console(record=True)
+console = Console()
 
 
 @click.command()
 @click.option("--email", "-e", help="Username")
 @click.option("--password", "-p", help="Password")
 @click.option("--json", is_flag=True, help="Default to output in JSON format")
-def config(email: str, password: str, json: bool) -> None:
+@click.option("--profile", help="name of the API profile to store the login under")
+@click.option(
+    "--url", help="base URL of the profile's API e.g. https://mesh-eu.example.com"
+)
+def config(email: str, password: str, json: bool, profile: str, url: str) -> None:
     """Stores access token and global settings of the user.
 
     Args:
         email (str): user email
         password (str): user password
+        profile (str): name of the API profile, for working with several meshes.
+        url (str): base URL of the profile's API.
     """
-    if email and password:
-        store_access_token(email, password, json)
-        access_token = retrieve_access_token()
-        logger.info(f"Storage of access token: {access_token}")
-    else:
+    if not (email and password):
         email = click.prompt("Email", type=str)
         password = click.prompt("Password", type=str)
-        store_access_token(email, password, json)
-        access_token = retrieve_access_token()
-        logger.info(f"Storage of access token: {access_token}")
+    store_access_token(email, password, json, profile, url)
+    use_profile(profile)
+    access_token = retrieve_access_token()
+    logger.info(f"Storage of access token: {access_token}")
+
+
+def invoked_target_item() -> str:
+    """Name of the group the running command was invoked from, e.g. node or port."""
+    context = click.get_current_context()
+    return context.parent.info_name if context.parent else "node"
+
+
+def complete_node_ids(ctx, param, incomplete: str) -> list:
+    """Completes node IDs from the local name index, matching on ID or name."""
+    try:
+        index = load_name_index("node", max_age=float("inf"))
+    except Exception:
+        return []
+    return [
+        CompletionItem(key, help=index.names[key]) for key in index.complete(incomplete)
+    ]
+
+
+def list_items(
+    target_item: str,
+    all: bool,
+    state: str,
+    age: int,
+    interface: str,
+    type: str,
+    where: str = None,
+    ordering: list = (),
+    top: int = None,
+) -> object:
+    """Requests the items matching the `ls` options from the active profile.
+
+    Returns:
+        object: the response, the matching items when filtering with `where` or
+            sorting, or None when no listing option was given.
+    """
+    if where or ordering or top:
+        filters = [f"({where})"] if where else []
+        if interface:
+            filters.append(f"node_id={interface}")
+            return list_where("interface", " and ".join(filters), ordering, top)
+        if state:
+            filters.append(f"state={state}")
+        if type:
+            filters.append(f"type={type}")
+        if age:
+            filters.append(f"age<={age}")
+        return list_where(target_item, " and ".join(filters), ordering, top)
+    elif all:
+        return list_all(target_item)
+    elif state and age:
+        return list_by_state_and_age(age, state, target_item)
+    elif type and age:
+        return list_by_type_and_age(age, type, target_item)
+    elif type and state:
+        return list_by_type_and_state(type, state, target_item)
+    elif state:
+        return list_by_item_state(state, target_item)
+    elif type:
+        return search_by_type(target_item, type)
+    elif interface:
+        return search_by_interface("interface", interface)
+    elif age:
+        return list_by_item_age(age, target_item)
+
+
+def parse_ordering(target_item: str, sort: str, desc: bool) -> list:
+    """Parses the `--sort` and `--desc` options into an ordering.
+
+    Returns:
+        list: (column, descending) pairs, empty when not sorting.
+    """
+    if desc and not sort:
+        raise click.UsageError("--desc needs a field to sort by, e.g. --sort age.")
+    try:
+        return parse_sort(sort, target_item, desc) if sort else []
+    except WhereSyntaxError as e:
+        raise click.BadParameter(str(e), param_hint="--sort")
+
+
+def print_merged_results(
+    target_item: str, responses: dict, ordering: list, top: int, json: bool
+) -> None:
+    """Merges the results from several profiles, re-applies the ordering and prints them."""
+    items = merge_profile_results(responses)
+    if ordering or top:
+        items = top_n(items, ordering, top)
+    if target_item == "interface":
+        print_interface_results(items, json)
+    else:
+        print_results(target_item, items, json)
 
 
 @click.command()
@@ -75,15 +198,38 @@ def config(email: str, password: str, json: bool) -> None:
 @click.option(
     "--interface",
     help="provide the node_id to view interfaces on that node: `xbot node ls --interface <node_id>`",
+    shell_complete=complete_node_ids,
 )
 @click.option(
     "--age",
     help="list items provisioned within a certain timeframe e.g. xbot node ls --age 55",
     type=int,
 )
+@click.option(
+    "--where",
+    help="filter expression e.g. xbot node ls --where \"state in (active,error) and age<7 and name~'ingest'\"",
+)
+@click.option("--sort", help="comma-separated fields to sort by e.g. --sort state,age")
+@click.option("--desc", is_flag=True, help="sort from largest to smallest")
+@click.option("--top", type=click.IntRange(min=1), help="only return the first N items")
 @click.option("--json", "-j", is_flag=True, help="print more output.")
+@click.option("--profile", help="name of the API profile to query")
+@click.option(
+    "--all-profiles", is_flag=True, help="query every configured profile at once"
+)
 def ls(
-    all: str, state: str, age: int, interface: str, type: str, json: bool = False
+    all: str,
+    state: str,
+    age: int,
+    interface: str,
+    type: str,
+    where: str = None,
+    sort: str = None,
+    desc: bool = False,
+    top: int = None,
+    json: bool = False,
+    profile: str = None,
+    all_profiles: bool = False,
 ) -> None:
     """List items in the mesh.
 
@@ -92,80 +238,150 @@ def ls(
         type (str): list items by type.
         interface (str): provide the node_id to view all interfaces on that node. Example: `xbot node ls --interface <node_id>`
         age (int): number of days search criteria should apply to.
+        where (str): filter expression combining conditions with and, or and not.
+            Operators: = != < <= > >= ~ (contains) !~ =~ (regex) in (...) is null.
+        sort (str): fields to sort by. Example: `xbot node ls --state error --sort age --top 10`
+        desc (bool): sort from largest to smallest.
+        top (int): only return the first N items.
         json (bool): whether to print the data in JSON format. Defaults to False.
+        profile (str): name of the API profile to query.
+        all_profiles (bool): query every configured profile and merge the results.
     """
-    target_item = sys.argv[1] if len(sys.argv) > 1 else "node"
-    if len(sys.argv) > 4:
-        paramater = sys.argv[4]
-    else:
-        paramater = None
-    base_url = f"http://localhost:3000/{target_item}s"
-    response = request_data(base_url)
+    target_item = invoked_target_item()
+    use_profile(profile)
+    if where:
+        try:
+            parse(where, target_item)
+        except WhereSyntaxError as e:
+            raise click.BadParameter(str(e), param_hint="--where")
+    query = where or sort or top
     if target_item == "node" or target_item == "port":
-        if response is not None:
-            if all:
-                print_search(target_item, response, json)
-            elif state and age:
-                response = list_by_state_and_age(age, state, target_item, json)
-                print_search(target_item, response, json)
-            elif type and age:
-                response = list_by_type_and_age(age, type, target_item, json)
-                print_search(target_item, response, json)
-            elif type and state:
-                response = list_by_type_and_state(type, state, target_item, json)
-                print_search(target_item, response, json)
-            elif state:
-                response = list_by_item_state(state, target_item, json)
-                print_search(target_item, response, json)
-            elif type:
-                response = search_by_type(target_item, paramater)
-                print_search(target_item, response, json)
-            elif interface:
-                response = search_by_interface("interface", paramater)
-                print_search("interface", response, json)
-            elif age:
-                response = list_by_item_age(age, target_item, json)
-                print_search(target_item, response, json)
-            else:
-                console.print(
-                    f"Hmm, I'm not sure what you want me to do. Try [bold green]`xbot {target_item} ls --all`[/bold green] to view all {target_item}s, or [bold green]`xbot {target_item} ls --help`[/bold green] for more options."
-                )
+        if interface and (query or not (all or state or type)):
+            printed_item = "interface"
+        else:
+            printed_item = target_item
+        ordering = parse_ordering(printed_item, sort, desc)
+        fetch = partial(
+            list_items,
+            target_item,
+            all,
+            state,
+            age,
+            interface,
+            type,
+            where,
+            ordering,
+            top,
+        )
+        if not (all or state or age or interface or type or query):
+            console.print(
+                f"Hmm, I'm not sure what you want me to do. Try [bold green]`xbot {target_item} ls --all`[/bold green] to view all {target_item}s, or [bold green]`xbot {target_item} ls --help`[/bold green] for more options."
+            )
+        elif all_profiles:
+            print_merged_results(printed_item, fan_out(fetch), ordering, top, json)
+        elif query:
+            try:
+                print_results(printed_item, fetch(), json)
+            except requests.RequestException as e:
+                logger.error(e)
+                print_error_message()
         else:
-            exit()
+            response = fetch()
+            if response is not None:
+                print_search(printed_item, response, json)
+            else:
+                exit()
     elif target_item == "interface":
-        if response is not None:
-            print_interface_results(response, json)
+        ordering = parse_ordering(target_item, sort, desc)
+        if query:
+            fetch = partial(list_where, target_item, where, ordering, top)
+        else:
+            fetch = partial(list_all, target_item)
+        if all_profiles:
+            print_merged_results(target_item, fan_out(fetch), ordering, top, json)
+        else:
+            response = fetch()
+            if response is not None:
+                print_interface_results(response, json)
 
 
 @click.command()
 @click.option("--name", "-n", help="name of the node you're searching for")
 @click.option("--id", "-id", help="name of the node you're searching for")
+@click.option("--sort", help="comma-separated fields to sort by e.g. --sort state,age")
+@click.option("--desc", is_flag=True, help="sort from largest to smallest")
+@click.option("--top", type=click.IntRange(min=1), help="only return the first N items")
 @click.option("--json", "-j", is_flag=True, help="print more output.")
-def search(name: str, id: str, json: bool) -> None:
+@click.option("--profile", help="name of the API profile to query")
+@click.option(
+    "--all-profiles", is_flag=True, help="query every configured profile at once"
+)
+def search(
+    name: str,
+    id: str,
+    sort: str = None,
+    desc: bool = False,
+    top: int = None,
+    json: bool = False,
+    profile: str = None,
+    all_profiles: bool = False,
+) -> None:
     """Search for a specific item.
 
     Args:
-        name (str): name of the item you're searching for
+        name (str): name of the item you're searching for. Matches are ranked, and
+            partial or misspelt names are accepted.
         id (str): ID of the item you're searching for
+        sort (str): fields to sort name matches by.
+        desc (bool): sort from largest to smallest.
+        top (int): only return the first N matches.
         json (bool): whether to print the data in JSON format. Defaults to False.
+        profile (str): name of the API profile to query.
+        all_profiles (bool): query every configured profile and merge the results.
     """
-    target_item = sys.argv[1]
-    argument = sys.argv[4]
+    target_item = invoked_target_item()
+    use_profile(profile)
+    ordering = parse_ordering(target_item, sort, desc)
     if name:
-        response = search_by_name(target_item, argument)
-        print_search(target_item, response, json)
+        fetch = partial(fuzzy_search, target_item, name, ordering, top)
     elif id:
-        response = search_by_id(target_item, argument)
-        print_search(target_item, response, json)
+        fetch = partial(search_by_id, target_item, id)
+    else:
+        return
+    if all_profiles:
+        print_merged_results(target_item, fan_out(fetch), ordering, top, json)
+    elif name:
+        try:
+            print_results(target_item, fetch(), json)
+        except requests.RequestException as e:
+            logger.error(e)
+            print_error_message()
+    else:
+        print_search(target_item, fetch(), json)
 
 
 @click.command()
-def total() -> None:
+@click.option("--profile", help="name of the API profile to query")
+@click.option(
+    "--all-profiles", is_flag=True, help="query every configured profile at once"
+)
+def total(profile: str = None, all_profiles: bool = False) -> None:
     """This command lists the total number of items present in the mesh. Example: `xbot node list --total` will list the total number of items in the mesh."""
-    target_item = sys.argv[1]
-    base_url = f"http://localhost:3000/{target_item}s"
-    response = request_data(base_url)
-    response = response.json()
+    target_item = invoked_target_item()
+    use_profile(profile)
+    fetch = partial(list_all, target_item)
+    if all_profiles:
+        responses = fan_out(fetch)
+        response = merge_profile_results(responses)
+        for name in responses:
+            count = sum(1 for item in response if item["profile"] == name)
+            if responses[name] is not None and responses[name].status_code == 200:
+                console.print(f"{name}: [bold]{count}[/bold] {target_item}s")
+    else:
+        response = fetch()
+        if response is None:
+            sys.exit(1)
+        response = response.json()
     console.print(
         f"There are [bold red]{len(response)} [/bold red]{target_item}s in your mesh."
         + "\n"
@@ -173,33 +389,300 @@ def total() -> None:
 
 
 @click.command()
-@click.argument("id", type=str)
-@click.option("--tree", is_flag=True, help="print as ancestor tree")
+@click.argument("ids", nargs=-1, required=True, shell_complete=complete_node_ids)
+@click.option("--json", "-j", is_flag=True, help="print one JSON object per node.")
+@click.option("--profile", help="name of the API profile to query")
+def inspect(ids: tuple, json: bool = False, profile: str = None) -> None:
+    """View nodes together with their ports and interfaces.
+
+    Args:
+        ids (tuple): IDs of the nodes to inspect.
+
+        Example: `xbot node inspect {node_id} {node_id}`. The nodes, ports and interfaces are fetched in a single request.
+    """
+    use_profile(profile)
+    ids = list(dict.fromkeys(ids))
+    try:
+        printed = print_topology(inspect_nodes(ids), json)
+    except requests.RequestException as e:
+        logger.error(e)
+        print_error_message()
+        return
+    missing = [id for id in ids if id not in printed]
+    if missing:
+        console.print(f"No nodes found with ID: {', '.join(missing)}")
+
+
+def show_lineage(
+    ids: tuple, where: str, target_lineage: str, tree: bool, json: bool
+) -> None:
+    """Prints the combined lineage of the given nodes and of the nodes matching `where`."""
+    names = {}
+    if where:
+        try:
+            parse(where, "node")
+        except WhereSyntaxError as e:
+            raise click.BadParameter(str(e), param_hint="--from-ls")
+    elif not ids:
+        raise click.UsageError("Pass one or more node IDs, or --from-ls.")
+    try:
+        if where:
+            nodes = list_where("node", where, columns=["id", "name"])
+            names = {node["id"]: node["name"] for node in nodes}
+            if not names:
+                console.print(f"No nodes match {where}.")
+                return
+        ids = list(dict.fromkeys(list(ids) + list(names)))
+        missing = print_lineage(ids, target_lineage, tree, json, names)
+    except requests.RequestException as e:
+        logger.error(e)
+        print_error_message()
+        return
+    if missing:
+        console.print(f"No nodes found with ID: {', '.join(missing)}")
+
+
+@click.command()
+@click.argument("ids", nargs=-1, shell_complete=complete_node_ids)
+@click.option(
+    "--from-ls",
+    "where",
+    help='also use the nodes matching a --where filter e.g. --from-ls "category=ingest"',
+)
+@click.option("--tree", is_flag=True, help="print as descendant tree")
 @click.option("--json", "-j", is_flag=True, help="print output in JSON format.")
-def descendants(id: str, tree: bool = False, json: bool = False) -> None:
-    """View the descendants of a node.
+@click.option("--profile", help="name of the API profile to query")
+def descendants(
+    ids: tuple,
+    where: str = None,
+    tree: bool = False,
+    json: bool = False,
+    profile: str = None,
+) -> None:
+    """View the descendants of one or more nodes.
 
     Args:
-        id (str): Node ID of the node you wish to view ancestors of.
+        ids (tuple): Node IDs of the nodes you wish to view descendants of.
 
-        Example: `xbot node descendants {node_id}`. Hint: If you're uncertain of the ID of a node, use the `xbot node ls` command to find it.
+        Example: `xbot node descendants {node_id} {node_id}` or `xbot node descendants --from-ls "category=ingest"`. Nodes shared by several of them are listed once. Hint: If you're uncertain of the ID of a node, use the `xbot node ls` command to find it.
     """
-    requested_data = fetch_lineage(id)
-    print_lineage(requested_data, id, "descendant", tree, json)
+    use_profile(profile)
+    show_lineage(ids, where, "descendant", tree, json)
 
 
 @click.command()
-@click.argument("id", type=str)
+@click.argument("ids", nargs=-1, shell_complete=complete_node_ids)
+@click.option(
+    "--from-ls",
+    "where",
+    help='also use the nodes matching a --where filter e.g. --from-ls "category=serve"',
+)
 @click.option("--tree", is_flag=True, help="print as ancestor tree")
 @click.option("--json", "-j", is_flag=True, help="print output in JSON format.")
-def ancestors(id: str, tree: bool = False, json: bool = False) -> None:
-    """View the ancestors of a node.
+@click.option("--profile", help="name of the API profile to query")
+def ancestors(
+    ids: tuple,
+    where: str = None,
+    tree: bool = False,
+    json: bool = False,
+    profile: str = None,
+) -> None:
+    """View the ancestors of one or more nodes.
+
+    Args:
+        ids (tuple): Node IDs of the nodes you wish to view ancestors of.
+
+        Example: `xbot node ancestors {node_id} {node_id}` or `xbot node ancestors --from-ls "category=serve"`. Nodes shared by several of them are listed once. Hint: If you're uncertain of the ID of a node, use the `xbot node ls` command to find it.
+    """
+    use_profile(profile)
+    show_lineage(ids, where, "ancestor", tree, json)
+
+
+@click.command()
+@click.argument("id", type=str, shell_complete=complete_node_ids)
+@click.option(
+    "--category",
+    help="only list affected nodes in this category e.g. serve",
+    type=click.Choice(ITEM_CATEGORIES),
+)
+@click.option(
+    "--upstream", is_flag=True, help="list the ancestors the node depends on instead"
+)
+@click.option("--json", "-j", is_flag=True, help="print output in JSON format.")
+@click.option("--profile", help="name of the API profile to query")
+def impact(
+    id: str,
+    category: str = None,
+    upstream: bool = False,
+    json: bool = False,
+    profile: str = None,
+) -> None:
+    """View every node downstream of a node, e.g. the serve nodes hit by a failing ingest node.
+
+    Args:
+        id (str): Node ID of the node to start from.
+
+        Example: `xbot graph impact {node_id} --category serve`. Nodes only reached through an unhealthy node are marked with !.
+    """
+    use_profile(profile)
+    try:
+        graph, nodes = load_mesh_graph()
+    except requests.RequestException as e:
+        logger.error(e)
+        print_error_message()
+        return
+    print_impact(id, graph, nodes, upstream, category, json=json)
+
+
+@click.command()
+@click.argument("start", type=str, shell_complete=complete_node_ids)
+@click.argument("end", type=str, shell_complete=complete_node_ids)
+@click.option("--json", "-j", is_flag=True, help="print output in JSON format.")
+@click.option("--profile", help="name of the API profile to query")
+def path(start: str, end: str, json: bool = False, profile: str = None) -> None:
+    """View the shortest lineage path between two nodes.
 
     Args:
-        id (str): Node ID of the node you wish to view ancestors of.
+        start (str): Node ID of the upstream node.
+        end (str): Node ID of the downstream node.
 
-        Example: `xbot node ancestors {node_id}`. Hint: If you're uncertain of the ID of a node, use the `xbot node ls` command to find it.
+        Example: `xbot graph path {node_id} {node_id}`. If there is no path downstream from start to end, the reverse direction is tried.
     """
+    use_profile(profile)
+    try:
+        graph, nodes = load_mesh_graph()
+    except requests.RequestException as e:
+        logger.error(e)
+        print_error_message()
+        return
+    route = graph.shortest_path(start, end)
+    if not route:
+        route = graph.shortest_path(end, start)
+        if route:
+            console.print(f"{end} is upstream of {start}:")
+    if route:
+        print_graph_path(route, nodes, json)
+    else:
+        console.print(f"There is no lineage path between {start} and {end}.")
+
+
+@click.command()
+@click.option(
+    "--top", type=click.IntRange(min=1), default=10, help="number of nodes to list"
+)
+@click.option("--json", "-j", is_flag=True, help="print output in JSON format.")
+@click.option("--profile", help="name of the API profile to query")
+def stats(top: int = 10, json: bool = False, profile: str = None) -> None:
+    """View the shape of the mesh: sources, sinks, cycles, longest chain and busiest nodes.
 
-    requested_data = fetch_lineage(id)
-    print_lineage(requested_data, id, "ancestor", tree, json=json)
+    Example: `xbot graph stats --top 5`
+    """
+    use_profile(profile)
+    try:
+        graph, nodes = load_mesh_graph()
+    except requests.RequestException as e:
+        logger.error(e)
+        print_error_message()
+        return
+    print_graph_stats(graph.stats(top), nodes, json)
+
+
+@click.command()
+@click.option(
+    "--file",
+    "-f",
+    type=click.File("r"),
+    required=True,
+    help="YAML or JSON file listing the items that should exist, or - for stdin",
+)
+@click.option("--prune", is_flag=True, help="delete items that aren't in the file")
+@click.option("--dry-run", is_flag=True, help="list the changes without making them")
+@click.option("--yes", "-y", is_flag=True, help="don't ask before deleting items")
+@click.option("--json", "-j", is_flag=True, help="print output in JSON format.")
+@click.option("--profile", help="name of the API profile to change")
+def apply(
+    file,
+    prune: bool = False,
+    dry_run: bool = False,
+    yes: bool = False,
+    json: bool = False,
+    profile: str = None,
+) -> None:
+    """Create, update and delete items to match a file.
+
+    Args:
+        file (io.TextIOBase): manifest listing the desired items, at the top level or under e.g. `nodes:`.
+            Nodes are matched by `id`, or by `name` when the ID is left out. Ports are matched by
+            `node_id` and `port_number`, and only the ports on the nodes in the file are compared.
+        prune (bool): delete current items that aren't in the file.
+        dry_run (bool): list the changes without making them.
+
+        Example: `xbot node apply -f nodes.yaml --dry-run`. Changes are sent as batched bulk requests.
+    """
+    target_item = invoked_target_item()
+    use_profile(profile)
+    desired = load_manifest(file, target_item)
+    try:
+        current = list_current_items(target_item, desired)
+        plan = plan_changes(desired, current, ITEM_KEYS[target_item], prune)
+    except ManifestError as e:
+        raise click.BadParameter(str(e), param_hint="--file")
+    except requests.RequestException as e:
+        logger.error(e)
+        print_error_message()
+        return
+    print_plan(target_item, plan, details=dry_run, json=json)
+    if dry_run:
+        return
+    if plan["delete"] and not yes:
+        click.confirm(f'Delete {len(plan["delete"])} {target_item}s?', abort=True)
+    errors = []
+    if plan["create"] or plan["update"] or plan["delete"]:
+        errors = apply_changes(target_item, plan, progress=not json)
+    print_apply_errors(target_item, plan, errors, json)
+    if errors:
+        sys.exit(1)
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="address to listen on")
+@click.option("--port", default=9464, type=int, help="port to serve /metrics on")
+@click.option(
+    "--interval",
+    default=60.0,
+    type=click.FloatRange(min=1),
+    help="seconds between refreshes of the counts",
+)
+@click.option("--profile", help="name of the API profile to query")
+@click.option(
+    "--all-profiles", is_flag=True, help="export every configured profile at once"
+)
+def exporter(
+    host: str = "127.0.0.1",
+    port: int = 9464,
+    interval: float = 60.0,
+    profile: str = None,
+    all_profiles: bool = False,
+) -> None:
+    """Serve node and port counts to Prometheus on /metrics.
+
+    Args:
+        host (str): address to listen on. Use 0.0.0.0 to accept scrapes from other machines.
+        port (int): port to serve /metrics on.
+        interval (float): seconds between refreshes. Scrapes are answered from the last refresh.
+
+        Example: `xbot exporter --port 9464 --interval 30`
+    """
+    use_profile(profile)
+    collect = partial(
+        collect_mesh_metrics,
+        ITEM_STATES,
+        ITEM_TYPES,
+        PORT_STATES,
+        list_profiles() if all_profiles else [active_profile_name()],
+        last_results={},
+    )
+    console.print(
+        f"Serving metrics on http://{host}:{port}/metrics, refreshed every {interval:g}s."
+    )
+    serve_metrics(collect, host, port, interval)
@@ -0,0 +1,256 @@
+"""Client and server halves of xbotd, the optional long-lived xbot process.
+
+The client half only relies on the standard library so that the `xbot` entry
+point can hand a command to a running daemon before click, rich and requests
+are imported. The daemon imports those once, keeps the pooled session, parsed config
+and response cache warm, and runs forwarded commands in-process.
+"""
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import traceback
+
+from contextlib import redirect_stderr, redirect_stdout
+
+SOCKET_PATH = os.environ.get(
+    "XBOTD_SOCKET", os.path.join(tempfile.gettempdir(), f"xbotd-{os.getuid()}.sock")
+)
+IDLE_TIMEOUT = float(os.environ.get("XBOTD_IDLE_TIMEOUT", 900))
+CACHE_TTL = float(os.environ.get("XBOTD_CACHE_TTL", 30))
+
+# Commands that prompt for input or run their own server stay in-process.
+LOCAL_COMMANDS = ["config", "apply", "exporter"]
+# Set by the shell for click's tab completion. Completions are answered by the
+# daemon too, from its in-memory name index.
+COMPLETION_VARIABLES = ["_XBOT_COMPLETE", "COMP_WORDS", "COMP_CWORD"]
+
+
+class CapturedOutput(io.StringIO):
+    """Output buffer that reports the client's terminal state to rich and click."""
+
+    def __init__(self, isatty: bool = False):
+        super().__init__()
+        self._isatty = isatty
+
+    def isatty(self) -> bool:
+        return self._isatty
+
+
+def forward(argv: list) -> int:
+    """Forwards a command to a running xbotd and prints its output.
+
+    Args:
+        argv (list): command line arguments, excluding the program name.
+
+    Returns:
+        int: the command's exit code, or None when it has to run in-process.
+    """
+    commands = [arg for arg in argv if not arg.startswith("-")][:2]
+    completing = bool(os.environ.get("_XBOT_COMPLETE"))
+    if not completing and (
+        not commands or any(command in LOCAL_COMMANDS for command in commands)
+    ):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(0.5)
+        client.connect(SOCKET_PATH)
+    except OSError:
+        client.close()
+        if os.environ.get("XBOT_DAEMON"):
+            start_daemon()
+        return None
+    try:
+        width = os.get_terminal_size(sys.stdout.fileno()).columns
+    except (OSError, ValueError):
+        width = None
+    request = {
+        "argv": argv,
+        "cwd": os.getcwd(),
+        "isatty": sys.stdout.isatty(),
+        "width": width,
+        "colorterm": os.environ.get("COLORTERM", ""),
+        "environ": {
+            name: os.environ[name]
+            for name in COMPLETION_VARIABLES
+            if name in os.environ
+        },
+    }
+    with client:
+        client.settimeout(None)
+        client.sendall(json.dumps(request).encode() + b"\n")
+        reply = client.makefile("rb").read()
+    try:
+        reply = json.loads(reply)
+    except ValueError:
+        return None
+    sys.stdout.write(reply["output"])
+    sys.stdout.flush()
+    return reply["exit_code"]
+
+
+def main() -> None:
+    """Entry point of the `xbot` console script.
+
+    The CLI is only imported when no daemon took the command.
+    """
+    exit_code = forward(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+    from xbot import xbot
+
+    xbot(prog_name="xbot")
+
+
+def start_daemon() -> None:
+    """Starts xbotd in the background, detached from the calling terminal."""
+    script = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "xbotd.py"
+    )
+    subprocess.Popen(
+        [sys.executable, script],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def invalidate_daemon() -> None:
+    """Tells a running xbotd to drop its cached responses, e.g. after an apply.
+
+    The daemon handles requests in order, so commands forwarded afterwards see
+    the change. Does nothing when no daemon is running.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with client:
+        try:
+            client.settimeout(0.5)
+            client.connect(SOCKET_PATH)
+            client.sendall(json.dumps({"invalidate": True}).encode() + b"\n")
+        except OSError:
+            pass
+
+
+def run_command(cli, request: dict, consoles: list = ()) -> dict:
+    """Runs one forwarded command against the click group and captures its output.
+
+    Args:
+        cli (click.Group): the xbot command group.
+        request (dict): the decoded client request.
+        consoles (list): rich consoles whose colour support should follow the client.
+
+    Returns:
+        dict: the captured output and exit code.
+    """
+    from rich.color import ColorSystem
+
+    argv = request["argv"]
+    buffer = CapturedOutput(request.get("isatty", False))
+    if request.get("isatty"):
+        if request.get("colorterm") in ("truecolor", "24bit"):
+            color_system = ColorSystem.TRUECOLOR
+        else:
+            color_system = ColorSystem.EIGHT_BIT
+    else:
+        color_system = None
+    for console in consoles:
+        console._color_system = color_system
+    if request.get("width"):
+        os.environ["COLUMNS"] = str(request["width"])
+    else:
+        os.environ.pop("COLUMNS", None)
+
+    environ = {
+        name: value
+        for name, value in request.get("environ", {}).items()
+        if name in COMPLETION_VARIABLES
+    }
+    old_argv, old_cwd = sys.argv, os.getcwd()
+    sys.argv = ["xbot"] + argv
+    exit_code = 0
+    try:
+        os.environ.update(environ)
+        os.chdir(request["cwd"])
+        with redirect_stdout(buffer), redirect_stderr(buffer):
+            cli.main(args=argv, prog_name="xbot")
+    except SystemExit as e:
+        if isinstance(e.code, int) or e.code is None:
+            exit_code = e.code or 0
+        else:
+            buffer.write(f"{e.code}\n")
+            exit_code = 1
+    except Exception:
+        buffer.write(traceback.format_exc())
+        exit_code = 1
+    finally:
+        for name in environ:
+            os.environ.pop(name, None)
+        sys.argv = old_argv
+        os.chdir(old_cwd)
+    return {"output": buffer.getvalue(), "exit_code": exit_code}
+
+
+def serve(
+    cli,
+    socket_path: str = SOCKET_PATH,
+    idle_timeout: float = IDLE_TIMEOUT,
+    consoles: list = (),
+    on_invalidate=None,
+) -> None:
+    """Accepts forwarded commands on a Unix socket until idle for `idle_timeout`.
+
+    Commands run one at a time because they share sys.argv, the working
+    directory and stdout.
+
+    Args:
+        cli (click.Group): the xbot command group.
+        socket_path (str): path of the Unix socket to listen on.
+        idle_timeout (float): seconds without a request before the daemon exits.
+        consoles (list): rich consoles used by the commands.
+        on_invalidate (callable): called when a client reports that the mesh
+            changed, to drop the daemon's caches.
+    """
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            probe.close()
+            return  # another daemon is already serving
+        except OSError:
+            os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    server.settimeout(idle_timeout)
+    try:
+        while True:
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                break
+            with connection:
+                connection.settimeout(None)
+                line = connection.makefile("rb").readline()
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    continue
+                if request.get("invalidate"):
+                    if on_invalidate:
+                        on_invalidate()
+                    continue
+                reply = run_command(cli, request, consoles)
+                connection.sendall(json.dumps(reply).encode())
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
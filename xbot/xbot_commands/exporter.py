@@ -0,0 +1,151 @@
+"""Prometheus exporter that serves mesh counts from an in-memory snapshot.
+
+A background thread calls a collect function every `interval` seconds and
+renders its metric families to the text exposition format. Scrapes are
+answered with the last rendered snapshot, so they never wait on the API. If a
+refresh fails, the previous snapshot keeps being served and
+`xbot_exporter_last_refresh_success` drops to 0.
+
+Metric families are (name, help, samples) tuples, where samples are
+(labels, value) pairs and labels is a dict.
+"""
+import logging
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TEXT_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+logger = logging.getLogger()
+
+
+def escape_label(value) -> str:
+    """Escapes a label value for the exposition format."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(families: list) -> str:
+    """Renders metric families as gauges in the Prometheus text format.
+
+    Args:
+        families (list): (name, help, samples) tuples.
+
+    Returns:
+        str: the exposition text, without the OpenMetrics `# EOF` line.
+    """
+    lines = []
+    for name, help, samples in families:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            if labels:
+                pairs = ",".join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{pairs}}} {value}")
+            else:
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class Snapshot:
+    """The latest rendered metrics, replaced as a whole on each refresh."""
+
+    def __init__(self):
+        self.families = []
+        self.text = ""
+        self.refreshed_at = 0.0
+
+    def refresh(self, collect) -> bool:
+        """Collects fresh metric families and renders them.
+
+        Returns:
+            bool: whether the collect function succeeded.
+        """
+        started = time.time()
+        try:
+            self.families = collect()
+            succeeded, self.refreshed_at = True, time.time()
+        except Exception as e:
+            logger.error(f"Refreshing metrics failed: {e}")
+            succeeded = False
+        exporter_families = [
+            (
+                "xbot_exporter_last_refresh_success",
+                "Whether the last refresh of the mesh counts succeeded.",
+                [({}, int(succeeded))],
+            ),
+            (
+                "xbot_exporter_last_refresh_timestamp_seconds",
+                "Unix time of the last successful refresh.",
+                [({}, round(self.refreshed_at, 3))],
+            ),
+            (
+                "xbot_exporter_refresh_duration_seconds",
+                "Seconds the last refresh took.",
+                [({}, round(time.time() - started, 3))],
+            ),
+        ]
+        self.text = render(self.families + exporter_families)
+        return succeeded
+
+
+def refresh_forever(collect, snapshot: Snapshot, interval: float) -> None:
+    """Refreshes the snapshot every `interval` seconds, counted from each start."""
+    next_refresh = time.monotonic() + interval
+    while True:
+        time.sleep(max(0.0, next_refresh - time.monotonic()))
+        next_refresh = time.monotonic() + interval
+        snapshot.refresh(collect)
+
+
+def make_handler(snapshot: Snapshot) -> type:
+    """Builds a request handler class that serves `snapshot` on /metrics."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404, "Metrics are served on /metrics")
+                return
+            text = snapshot.text
+            if "application/openmetrics-text" in self.headers.get("Accept", ""):
+                content_type, text = OPENMETRICS_CONTENT_TYPE, f"{text}# EOF\n"
+            else:
+                content_type = TEXT_CONTENT_TYPE
+            body = text.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} {format % args}")
+
+    return MetricsHandler
+
+
+def serve_metrics(collect, host: str, port: int, interval: float) -> None:
+    """Serves /metrics until interrupted, refreshing the counts in the background.
+
+    The first refresh runs before the server starts listening, so the first
+    scrape already has data.
+
+    Args:
+        collect (callable): returns the metric families.
+        host (str): address to listen on.
+        port (int): port to listen on.
+        interval (float): seconds between refreshes.
+    """
+    snapshot = Snapshot()
+    snapshot.refresh(collect)
+    server = ThreadingHTTPServer((host, port), make_handler(snapshot))
+    threading.Thread(
+        target=refresh_forever, args=(collect, snapshot, interval), daemon=True
+    ).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,243 @@
+"""Mesh lineage as a compact directed graph, for analytics across every node.
+
+Node IDs are mapped to consecutive integers and edges are stored in
+compressed sparse row (CSR) form: `offsets[i]:offsets[i + 1]` indexes the
+slice of `targets` holding node i's neighbours. The graph keeps one CSR for
+edges going downstream (ancestor to descendant) and one for edges going
+upstream, so traversals in either direction only touch flat integer arrays.
+"""
+import heapq
+
+from array import array
+from collections import deque
+
+
+def build_csr(size: int, sources: array, destinations: array) -> tuple:
+    """Packs an edge list into CSR offsets and targets.
+
+    Args:
+        size (int): number of nodes.
+        sources (array): source node of each edge.
+        destinations (array): destination node of each edge.
+
+    Returns:
+        tuple: the offsets and targets arrays.
+    """
+    offsets = array("l", [0]) * (size + 1)
+    for source in sources:
+        offsets[source + 1] += 1
+    for i in range(size):
+        offsets[i + 1] += offsets[i]
+    position = array("l", offsets[:-1])
+    targets = array("l", [0]) * len(sources)
+    for source, destination in zip(sources, destinations):
+        targets[position[source]] = destination
+        position[source] += 1
+    return offsets, targets
+
+
+class MeshGraph:
+    """Directed lineage graph with downstream and upstream CSR adjacency."""
+
+    def __init__(self, edges):
+        """Builds the graph from (ancestor_id, descendant_id) pairs.
+
+        Duplicate edges and self-loops are dropped.
+        """
+        self.ids = []
+        self.index = {}
+        sources, destinations = array("l"), array("l")
+        seen = set()
+        for ancestor, descendant in edges:
+            if ancestor == descendant or (ancestor, descendant) in seen:
+                continue
+            seen.add((ancestor, descendant))
+            sources.append(self.add_node(ancestor))
+            destinations.append(self.add_node(descendant))
+        self.edge_count = len(sources)
+        self.down_offsets, self.down_targets = build_csr(
+            len(self.ids), sources, destinations
+        )
+        self.up_offsets, self.up_targets = build_csr(
+            len(self.ids), destinations, sources
+        )
+
+    def add_node(self, id: str) -> int:
+        if id not in self.index:
+            self.index[id] = len(self.ids)
+            self.ids.append(id)
+        return self.index[id]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def neighbours(self, node: int, upstream: bool = False) -> array:
+        offsets, targets = (
+            (self.up_offsets, self.up_targets)
+            if upstream
+            else (self.down_offsets, self.down_targets)
+        )
+        return targets[offsets[node] : offsets[node + 1]]
+
+    def fan_out(self, node: int) -> int:
+        return self.down_offsets[node + 1] - self.down_offsets[node]
+
+    def fan_in(self, node: int) -> int:
+        return self.up_offsets[node + 1] - self.up_offsets[node]
+
+    def bfs(self, start: str, upstream: bool = False, blocked: set = ()) -> list:
+        """Lists every node reachable from `start`, nearest first.
+
+        Args:
+            start (str): ID of the node to start from.
+            upstream (bool): follow edges towards ancestors instead of descendants.
+            blocked (set): IDs of nodes that are reached but not traversed further.
+
+        Returns:
+            list: (id, depth, parent_id) for each reachable node, excluding `start`.
+        """
+        if start not in self.index:
+            return []
+        root = self.index[start]
+        blocked = {self.index[id] for id in blocked if id in self.index} - {root}
+        depth = {root: 0}
+        parents = {}
+        queue = deque([root])
+        reached = []
+        while queue:
+            node = queue.popleft()
+            if node in blocked:
+                continue
+            for neighbour in self.neighbours(node, upstream):
+                if neighbour not in depth:
+                    depth[neighbour] = depth[node] + 1
+                    parents[neighbour] = node
+                    reached.append(neighbour)
+                    queue.append(neighbour)
+        return [
+            (self.ids[node], depth[node], self.ids[parents[node]]) for node in reached
+        ]
+
+    def shortest_path(self, start: str, end: str) -> list:
+        """Finds the shortest downstream path from `start` to `end`.
+
+        Returns:
+            list: the IDs along the path, or an empty list when `end` isn't reachable.
+        """
+        if start not in self.index or end not in self.index:
+            return []
+        root, goal = self.index[start], self.index[end]
+        parents = {root: None}
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            if node == goal:
+                path = []
+                while node is not None:
+                    path.append(self.ids[node])
+                    node = parents[node]
+                return path[::-1]
+            for neighbour in self.neighbours(node):
+                if neighbour not in parents:
+                    parents[neighbour] = node
+                    queue.append(neighbour)
+        return []
+
+    def topological_order(self) -> tuple:
+        """Orders nodes so that every ancestor comes before its descendants.
+
+        Uses Kahn's algorithm. Nodes on a cycle, and nodes downstream of one,
+        can't be ordered and are left out.
+
+        Returns:
+            tuple: the ordered node indexes, and the depth of each node, i.e. the
+                length of the longest path leading to it.
+        """
+        remaining = array("l", (self.fan_in(node) for node in range(len(self))))
+        depth = array("l", [0]) * len(self)
+        queue = deque(node for node in range(len(self)) if remaining[node] == 0)
+        order = []
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for neighbour in self.neighbours(node):
+                depth[neighbour] = max(depth[neighbour], depth[node] + 1)
+                remaining[neighbour] -= 1
+                if remaining[neighbour] == 0:
+                    queue.append(neighbour)
+        return order, depth
+
+    def cycles(self) -> list:
+        """Groups the nodes that lie on a cycle by strongly connected component.
+
+        Uses Kosaraju's algorithm: a downstream depth-first search records the
+        order in which nodes finish, then upstream searches started from the
+        last finished node collect one component each.
+
+        Returns:
+            list: the node indexes of each component with more than one node.
+        """
+        finished = []
+        visited = bytearray(len(self))
+        for start in range(len(self)):
+            if visited[start]:
+                continue
+            visited[start] = 1
+            stack = [[start, self.down_offsets[start]]]
+            while stack:
+                frame = stack[-1]
+                node, edge = frame
+                if edge < self.down_offsets[node + 1]:
+                    frame[1] += 1
+                    neighbour = self.down_targets[edge]
+                    if not visited[neighbour]:
+                        visited[neighbour] = 1
+                        stack.append([neighbour, self.down_offsets[neighbour]])
+                else:
+                    stack.pop()
+                    finished.append(node)
+        assigned = bytearray(len(self))
+        components = []
+        for root in reversed(finished):
+            if assigned[root]:
+                continue
+            assigned[root] = 1
+            component, stack = [root], [root]
+            while stack:
+                for neighbour in self.neighbours(stack.pop(), upstream=True):
+                    if not assigned[neighbour]:
+                        assigned[neighbour] = 1
+                        component.append(neighbour)
+                        stack.append(neighbour)
+            if len(component) > 1:
+                components.append(component)
+        return components
+
+    def stats(self, top: int = 10) -> dict:
+        """Summarises the shape of the graph.
+
+        Args:
+            top (int): number of nodes to list for fan-in and fan-out.
+
+        Returns:
+            dict: node and edge counts, sources, sinks, cycles and the nodes on
+                them, longest chain, and the nodes with the highest fan-in and fan-out.
+        """
+        order, depth = self.topological_order()
+        cycles = self.cycles()
+        nodes = range(len(self))
+        by_fan_in = heapq.nlargest(top, nodes, key=self.fan_in)
+        by_fan_out = heapq.nlargest(top, nodes, key=self.fan_out)
+        return {
+            "nodes": len(self),
+            "edges": self.edge_count,
+            "sources": sum(1 for node in nodes if self.fan_in(node) == 0),
+            "sinks": sum(1 for node in nodes if self.fan_out(node) == 0),
+            "cycles": len(cycles),
+            "nodes_on_cycles": sum(len(component) for component in cycles),
+            "longest_chain": max((depth[node] for node in order), default=0),
+            "top_fan_in": [(self.ids[node], self.fan_in(node)) for node in by_fan_in],
+            "top_fan_out": [
+                (self.ids[node], self.fan_out(node)) for node in by_fan_out
+            ],
+        }
@@ -0,0 +1,250 @@
+"""Local index of item names for fuzzy search and shell completion.
+
+Lowercased names and keys are held in sorted lists for prefix lookups with a
+binary search, and names in a trigram index for ranked, typo-tolerant
+matching. The structures are built the first time they are needed and then
+kept up to date as entries are added or removed. The sorted lists are stored
+with the index, so shell completion doesn't have to rebuild them.
+"""
+import bisect
+import heapq
+import re
+
+from collections import Counter
+from itertools import islice
+from operator import itemgetter
+
+# Separates a name from its key in the sorted names; names never contain a NUL.
+TERMINAL = "\0"
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+MIN_COVERAGE = 0.3
+CANDIDATES = 200
+
+
+def trigrams(text: str) -> set:
+    """Splits text into the padded trigrams used by PostgreSQL's pg_trgm.
+
+    Args:
+        text (str): the text to split.
+
+    Returns:
+        set: the trigrams of every word in the lowercased text.
+    """
+    grams = set()
+    for word in WORD_PATTERN.findall(text.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Damerau-Levenshtein distance between two strings, capped at `limit` + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+def name_entry(key: str, name: str) -> str:
+    """Joins a lowercased name and its key into an entry of the sorted names."""
+    return f"{name.lower()}{TERMINAL}{key}"
+
+
+def prefix_range(values: list, prefix: str, limit: int) -> list:
+    """Lists up to `limit` values of a sorted list that start with `prefix`."""
+    position = bisect.bisect_left(values, prefix)
+    matches = []
+    for value in islice(values, position, position + limit):
+        if not value.startswith(prefix):
+            break
+        matches.append(value)
+    return matches
+
+
+class NameIndex:
+    """Names keyed by item ID, searchable by prefix and by trigram similarity."""
+
+    def __init__(self, names: dict = None, refreshed_at: float = 0.0):
+        self.names = dict(names or {})
+        self.refreshed_at = refreshed_at
+        self._sorted_names = None
+        self._trigrams = None
+        self._trigram_counts = None
+        self._sorted_keys = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NameIndex":
+        index = cls(data["names"], data["refreshed_at"])
+        if "sorted_keys" in data and "sorted_names" in data:
+            index._sorted_keys = data["sorted_keys"]
+            index._sorted_names = data["sorted_names"]
+        return index
+
+    def to_dict(self) -> dict:
+        return {
+            "names": self.names,
+            "refreshed_at": self.refreshed_at,
+            "sorted_keys": self.sorted_keys,
+            "sorted_names": self.sorted_names,
+        }
+
+    @property
+    def sorted_names(self) -> list:
+        """Lowercased names followed by their key, e.g. `ingest-orders\\0<id>`."""
+        if self._sorted_names is None:
+            self._sorted_names = sorted(
+                name_entry(key, name) for key, name in self.names.items()
+            )
+        return self._sorted_names
+
+    @property
+    def trigram_index(self) -> dict:
+        if self._trigrams is None:
+            self._trigrams, self._trigram_counts = {}, {}
+            for key, name in self.names.items():
+                self._trigram_insert(key, name)
+        return self._trigrams
+
+    @property
+    def sorted_keys(self) -> list:
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self.names)
+        return self._sorted_keys
+
+    def _trigram_insert(self, key: str, name: str) -> None:
+        grams = trigrams(name)
+        self._trigram_counts[key] = len(grams)
+        for gram in grams:
+            self._trigrams.setdefault(gram, set()).add(key)
+
+    def add(self, key: str, name: str) -> None:
+        """Adds an item, or renames it if the key is already indexed."""
+        if self.names.get(key) == name:
+            return
+        if key in self.names:
+            self.remove(key)
+        self.names[key] = name
+        if self._sorted_names is not None:
+            bisect.insort(self._sorted_names, name_entry(key, name))
+        if self._trigrams is not None:
+            self._trigram_insert(key, name)
+        if self._sorted_keys is not None:
+            bisect.insort(self._sorted_keys, key)
+
+    def remove(self, key: str) -> None:
+        """Removes an item from the index."""
+        name = self.names.pop(key, None)
+        if name is None:
+            return
+        if self._sorted_names is not None:
+            entry = name_entry(key, name)
+            position = bisect.bisect_left(self._sorted_names, entry)
+            if self._sorted_names[position : position + 1] == [entry]:
+                del self._sorted_names[position]
+        if self._trigrams is not None:
+            for gram in trigrams(name):
+                self._trigrams.get(gram, set()).discard(key)
+            self._trigram_counts.pop(key, None)
+        if self._sorted_keys is not None:
+            position = bisect.bisect_left(self._sorted_keys, key)
+            del self._sorted_keys[position]
+
+    def sync(self, names: dict) -> tuple:
+        """Brings the index in line with a fresh listing, touching only what changed.
+
+        Args:
+            names (dict): every item's name keyed by its ID.
+
+        Returns:
+            tuple: the number of items added or renamed, and the number removed.
+        """
+        removed = [key for key in self.names if key not in names]
+        for key in removed:
+            self.remove(key)
+        changed = [key for key, name in names.items() if self.names.get(key) != name]
+        for key in changed:
+            self.add(key, names[key])
+        return len(changed), len(removed)
+
+    def complete(self, prefix: str, limit: int = 50) -> list:
+        """Lists the keys whose name or key starts with `prefix`.
+
+        Args:
+            prefix (str): the text typed so far.
+            limit (int): maximum number of keys to return.
+
+        Returns:
+            list: matching keys, ID matches first.
+        """
+        matches = prefix_range(self.sorted_keys, prefix, limit)
+        for entry in prefix_range(self.sorted_names, prefix.lower(), limit):
+            if len(matches) == limit:
+                break
+            key = entry.split(TERMINAL, 1)[1]
+            if key not in matches:
+                matches.append(key)
+        return matches
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """Ranks indexed items by how closely their name matches `query`.
+
+        Candidates share trigrams with the query. They are scored by the share of
+        the query's trigrams they contain, with bonuses for exact, prefix and
+        substring matches and for words within one or two typos of the query.
+
+        Args:
+            query (str): the (possibly misspelt) name to look for.
+            limit (int): maximum number of matches to return.
+
+        Returns:
+            list: (key, score) pairs, best match first.
+        """
+        if query in self.names:
+            return [(query, 3.0)]
+        text = query.lower()
+        query_grams = trigrams(text)
+        if not query_grams:
+            return [(key, 0.0) for key in self.complete(text, limit)]
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.trigram_index.get(gram, ()))
+        scores = {}
+        for key, count in shared.items():
+            coverage = count / len(query_grams)
+            if coverage < MIN_COVERAGE:
+                continue
+            similarity = count / (len(query_grams) + self._trigram_counts[key] - count)
+            scores[key] = coverage + similarity / 2
+        # Only the strongest candidates get the string comparisons below.
+        scores = dict(heapq.nlargest(CANDIDATES, scores.items(), key=itemgetter(1)))
+        for key in self.complete(text, limit):
+            scores.setdefault(key, 0.0)
+        typos = 1 if len(text) < 8 else 2
+        for key in scores:
+            name = self.names[key].lower()
+            if name == text:
+                scores[key] += 2.0
+            elif name.startswith(text):
+                scores[key] += 1.0
+            elif text in name:
+                scores[key] += 0.5
+            elif len(text) >= 4 and any(
+                edit_distance(text, word, typos) <= typos
+                for word in [name] + WORD_PATTERN.findall(name)
+            ):
+                scores[key] += 0.5
+        ranked = sorted(
+            scores.items(), key=lambda match: (-match[1], self.names[match[0]])
+        )
+        return ranked[:limit]
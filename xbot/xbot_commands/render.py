@@ -0,0 +1,67 @@
+"""Plain-text table rendering for results too large for rich.
+
+rich measures every cell, wraps text and keeps the whole table in memory
+before printing, which takes seconds for tens of thousands of rows. This
+renderer sizes the columns from a sample of the first rows, then streams every
+row as fixed-width text, writing a chunk of rows at a time. A value wider than
+its column in the rest of the output is written in full rather than cut.
+"""
+from itertools import chain, islice
+
+SAMPLE_ROWS = 1000
+CHUNK_ROWS = 1000
+GAP = "  "
+
+
+def column_widths(headers: list, rows: list) -> list:
+    """Works out the width of each column from its header and a sample of rows."""
+    widths = [len(header) for header in headers]
+    for row in rows:
+        for position, value in enumerate(row):
+            if len(value) > widths[position]:
+                widths[position] = len(value)
+    return widths
+
+
+def format_row(row, widths: list) -> str:
+    """Pads every value but the last to its column's width."""
+    cells = [value.ljust(width) for value, width in zip(row[:-1], widths)]
+    return GAP.join(cells + [row[-1]])
+
+
+def render_plain(
+    file,
+    title: str,
+    headers: list,
+    rows,
+    sample_rows: int = SAMPLE_ROWS,
+    chunk_rows: int = CHUNK_ROWS,
+) -> int:
+    """Writes a table as fixed-width plain text.
+
+    Args:
+        file (io.TextIOBase): where to write the table.
+        title (str): printed above the table.
+        headers (list): the column headers.
+        rows (iterable): tuples of strings, one value per column.
+        sample_rows (int): number of rows used to size the columns.
+        chunk_rows (int): number of rows formatted before each write.
+
+    Returns:
+        int: the number of rows written.
+    """
+    rows = iter(rows)
+    sample = list(islice(rows, sample_rows))
+    widths = column_widths(headers, sample)
+    rule = GAP.join("-" * width for width in widths)
+    file.write(f"{title}\n{format_row(headers, widths)}\n{rule}\n")
+    count = 0
+    rows = chain(sample, rows)
+    while True:
+        chunk = [format_row(row, widths) for row in islice(rows, chunk_rows)]
+        if not chunk:
+            break
+        count += len(chunk)
+        file.write("\n".join(chunk) + "\n")
+    file.flush()
+    return count
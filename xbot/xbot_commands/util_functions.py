@@ -1,9 +1,19 @@
+import codecs
+import copy
 import datetime
+import hashlib
+import itertools
 import json
 import logging
 import os
+import threading
+import time
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from itertools import islice
 from stat import S_IREAD, S_IWUSR
+from urllib.parse import quote
 
 import click
 import pytz
@@ -13,30 +23,117 @@ from dotenv import load_dotenv
 from requests.structures import CaseInsensitiveDict
 from rich import print
 from rich.console import Console
+from rich.progress import Progress
 from rich.style import Style
 from rich.table import Table
 from rich.tree import Tree
+from urllib3.util.request import ACCEPT_ENCODING
+
+from xbot_commands.changes import chunked, item_key, upsert_batches
+from xbot_commands.daemon import invalidate_daemon
+from xbot_commands.graph import MeshGraph
+from xbot_commands.name_index import NameIndex
+from xbot_commands.render import render_plain
+from xbot_commands.where import compile_where, order_query, parse_timestamp, top_n
 
 load_dotenv()
 
 console = Console()
+error_console = Console(stderr=True)
 
 FORMATTER = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 VALID_LOG_LEVELS = ["debug", "info", "warning", "error", "critical"]
+DEFAULT_BASE_URL = "http://localhost:3000"
+REQUEST_TIMEOUT = float(os.environ.get("XBOT_REQUEST_TIMEOUT", 60))
+NAME_INDEX_DIR = ".xbot_cache"
+NAME_INDEX_TTL = float(os.environ.get("XBOT_NAME_INDEX_TTL", 300))
+# Stored response bodies with their ETags, revalidated with If-None-Match. The
+# least recently used bodies are removed once the store grows past its size
+# cap, and any body unused for ETAG_CACHE_MAX_AGE seconds is removed, so URLs
+# that embed a timestamp, such as age filters, don't pile up.
+ETAG_CACHE_DIR = os.path.join(NAME_INDEX_DIR, "etags")
+ETAG_CACHE_MAX_BYTES = int(os.environ.get("XBOT_ETAG_CACHE_MB", 100)) * 1000**2
+ETAG_CACHE_MAX_AGE = float(os.environ.get("XBOT_ETAG_CACHE_MAX_AGE", 7 * 86400))
+# Columns that identify an item, in the name index and when applying manifests.
+ITEM_KEYS = {"node": ["id"], "port": ["node_id", "port_number"], "interface": ["id"]}
+FUZZY_SEARCH_LIMIT = 20
+UNHEALTHY_STATES = ["error", "stopped", "suspended"]
+# Node IDs per inspect request, keeping the URL well under common length limits.
+INSPECT_CHUNK_SIZE = 100
+# Table backend: auto switches from rich to plain text above TABLE_PLAIN_ROWS rows.
+TABLE_RENDERER = os.environ.get("XBOT_TABLE_RENDERER", "auto")
+TABLE_PLAIN_ROWS = int(os.environ.get("XBOT_TABLE_PLAIN_ROWS", 2000))
+# Rows per bulk upsert, and requests in flight at once when applying a manifest.
+APPLY_CHUNK_SIZE = 500
+APPLY_CONCURRENCY = 4
+# Keys per bulk delete. Port keys are long, so this keeps the URL short enough.
+APPLY_DELETE_CHUNK_SIZE = 50
+# Age buckets, in days, reported by the Prometheus exporter.
+EXPORTER_AGE_DAYS = [1, 7, 30, 90, 365]
 
 
 logger = logging.getLogger()
 
-
-def generate_access_token(email: str, password: str) -> str:
+# A single pooled session keeps TCP/TLS connections alive between requests.
+session = requests.Session()
+# Offer every encoding urllib3 can decode: gzip and deflate, plus br and zstd
+# when the brotli and zstandard packages are installed.
+session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+
+# Bytes received by the current command, summed across threads.
+transfer_stats = dict.fromkeys(
+    [
+        "requests",
+        "not_modified",
+        "cached",
+        "wire_bytes",
+        "decoded_bytes",
+        "reused_bytes",
+    ],
+    0,
+)
+_transfer_lock = threading.Lock()
+
+# Parsed config.json contents keyed by absolute path, invalidated on mtime change.
+_config_cache = {}
+
+# Responses keyed by (url, access_token). Disabled unless a TTL is set, which
+# the xbotd daemon does to keep a warm copy of recent listings.
+_response_cache = {}
+response_cache_ttl = 0
+
+# Name indexes keyed by (base_url, target_item), kept for the life of the process.
+_name_indexes = {}
+
+# Lineage graphs keyed by base_url, reused while the response cache is enabled.
+_mesh_graphs = {}
+
+# Streamed lineage rows keyed like _response_cache, reused while it is enabled.
+_lineage_rows = {}
+
+# The API profile selected for the current thread, so fan-out workers can each
+# talk to a different mesh.
+_profile_state = threading.local()
+
+
+def generate_access_token(
+    email: str, password: str, base_url: str = DEFAULT_BASE_URL
+) -> str:
     """Generates an access token required to make requests to the API.
 
+    Args:
+        email (str): email used to generate access token.
+        password (str): password used to generate access token.
+        base_url (str): base URL of the API to log in to.
+
     Returns:
         str: JWT access token that is used in the headers of all requests.
     """
     try:
-        url = "http://localhost:3000/rpc/login"
-        response = requests.post(url, json={"email": email, "password": password})
+        url = f"{base_url}/rpc/login"
+        response = session.post(
+            url, json={"email": email, "password": password}, timeout=REQUEST_TIMEOUT
+        )
         if response.status_code == 200:
             token = response.json()["token"]
             return token
@@ -51,15 +148,98 @@ def generate_access_token(email: str, password: str) -> str:
         exit()
 
 
+def read_config(filename: str = "config.json") -> dict:
+    """Reads the config file, re-using the parsed copy until the file changes.
+
+    Args:
+        filename (str): path to the config file. Defaults to config.json.
+
+    Returns:
+        dict: the parsed config.
+    """
+    path = os.path.abspath(filename)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _config_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "r") as openfile:
+        json_object = json.load(openfile)
+    _config_cache[path] = (mtime, json_object)
+    return json_object
+
+
+def list_profiles() -> list:
+    """Lists the API profiles in the config file.
+
+    Returns:
+        list: profile names, or ["default"] when only the top-level login is configured.
+    """
+    profiles = read_config().get("profiles", {})
+    return list(profiles) or ["default"]
+
+
+def use_profile(name: str = None) -> None:
+    """Selects the API profile used by requests made from the current thread.
+
+    Args:
+        name (str): name of a profile in the config file. None falls back to the
+            XBOT_PROFILE environment variable, then to `default_profile` in the config.
+    """
+    if name and name != "default" and name not in list_profiles():
+        raise click.UsageError(
+            f"There is no profile called '{name}'. Run `xbot config --profile {name} --url <api_url>` to add it."
+        )
+    _profile_state.name = name
+
+
+def active_profile_name() -> str:
+    """Name of the API profile used by the current thread.
+
+    Returns:
+        str: the selected profile, then XBOT_PROFILE, then `default_profile` in the
+            config, or "default" when only the top-level login is configured.
+    """
+    return (
+        getattr(_profile_state, "name", None)
+        or os.environ.get("XBOT_PROFILE")
+        or read_config().get("default_profile")
+        or "default"
+    )
+
+
+def retrieve_profile() -> dict:
+    """Retrieves the base URL and access token of the active API profile.
+
+    Returns:
+        dict: the profile's `base_url` and `access_token`.
+    """
+    config = read_config()
+    profile = config.get("profiles", {}).get(active_profile_name(), config)
+    return {
+        "base_url": profile.get("base_url", DEFAULT_BASE_URL),
+        "access_token": profile["access_token"],
+    }
+
+
+def api_base_url() -> str:
+    """Retrieves the base URL of the active API profile.
+
+    Returns:
+        str: the base URL, e.g. http://localhost:3000.
+    """
+    try:
+        return retrieve_profile()["base_url"]
+    except (OSError, ValueError, KeyError):
+        return DEFAULT_BASE_URL
+
+
 def retrieve_access_token() -> str:
     """Retrieve access token used to access API.
 
     Returns:
         str: access token used to access API.
     """
-    with open("config.json", "r") as openfile:
-        json_object = json.load(openfile)
-        access_token = json_object["access_token"]
+    access_token = retrieve_profile()["access_token"]
     return access_token
 
 
@@ -69,25 +249,41 @@ def retrieve_output_format() -> str:
     Returns:
         str: the output format.
     """
-    with open("config.json", "r") as openfile:
-        json_object = json.load(openfile)
-        output_format = json_object["output_format"]
+    output_format = read_config()["output_format"]
     return output_format
 
 
-def store_access_token(email: str, password: str, json_format: bool) -> None:
+def store_access_token(
+    email: str,
+    password: str,
+    json_format: bool,
+    profile: str = None,
+    base_url: str = None,
+) -> None:
     """Store access token used to access API.
 
     Args:
         email (str): email used to generate access token.
         password (str[): password used to generate access token.
+        json_format (bool): whether to default to output in JSON format.
+        profile (str): name of the API profile to store the token under. Defaults to the top-level login.
+        base_url (str): base URL of the profile's API. Keeps the stored URL when not given.
     """
-    access_token = generate_access_token(email, password)
-    if json_format:
-        data = {"access_token": access_token, "output_format": "json"}
-    else:
-        data = {"access_token": access_token, "output_format": "default"}
     filename = "config.json"
+    try:
+        data = copy.deepcopy(read_config(filename))
+    except (OSError, ValueError):
+        data = {}
+    if profile:
+        settings = data.setdefault("profiles", {}).setdefault(profile, {})
+        data.setdefault("default_profile", profile)
+    else:
+        settings = data
+    settings["base_url"] = base_url or settings.get("base_url", DEFAULT_BASE_URL)
+    settings["access_token"] = generate_access_token(
+        email, password, settings["base_url"]
+    )
+    data["output_format"] = "json" if json_format else "default"
     try:
         os.chmod(filename, S_IWUSR | S_IREAD)
         with open(filename, "w") as outfile:
@@ -99,6 +295,24 @@ def store_access_token(email: str, password: str, json_format: bool) -> None:
             json.dump(data, outfile)
 
 
+def enable_response_cache(ttl: float) -> None:
+    """Keeps successful responses in memory for `ttl` seconds.
+
+    Args:
+        ttl (float): seconds a cached response stays valid. 0 disables the cache.
+    """
+    global response_cache_ttl
+    response_cache_ttl = ttl
+    clear_response_cache()
+
+
+def clear_response_cache() -> None:
+    """Drops cached responses and lineage, e.g. once the mesh has changed."""
+    _response_cache.clear()
+    _mesh_graphs.clear()
+    _lineage_rows.clear()
+
+
 def request_data(base_url: str) -> dict:
     """Requests data from the API.
 
@@ -107,15 +321,50 @@ def request_data(base_url: str) -> dict:
 
     Returns:
         list: JSON object containing the data requested based on the base_url.
+
+    Raises:
+        requests.RequestException: when the API can't be reached from a fan_out
+            worker. Elsewhere the error is printed and None is returned.
     """
     try:
         access_token = retrieve_access_token()
         request_url = f"{base_url}"
+        cache_key = (request_url, access_token)
+        if response_cache_ttl:
+            cached = _response_cache.get(cache_key)
+            if cached and time.monotonic() - cached[0] < response_cache_ttl:
+                with _transfer_lock:
+                    transfer_stats["cached"] += 1
+                return cached[1]
         headers = CaseInsensitiveDict()
         headers["Accept"] = "application/json"
         headers["Authorization"] = f"Bearer {access_token}"
-        response = requests.get(request_url, headers=headers)
+        path = etag_path(request_url, access_token)
+        etag, body = load_etag(path)
+        if etag:
+            headers["If-None-Match"] = etag
+        response = session.get(request_url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 304 and etag:
+            # Unchanged since it was stored, so answer with the stored body.
+            response.status_code = 200
+            response._content = body
+            record_transfer(response, reused_body=body)
+            touch_etag(path)
+        else:
+            record_transfer(response, len(response.content))
+            if response.status_code == 200 and response.headers.get("ETag"):
+                store_etag(path, response.headers["ETag"], response.content)
+        if response_cache_ttl and response.status_code == 200:
+            _response_cache[cache_key] = (time.monotonic(), response)
         return response
+    except requests.RequestException as e:
+        if getattr(_profile_state, "fanning_out", False):
+            # fan_out reports the profile as failed and carries on with the others.
+            raise
+        logger.error(e)
+        console.print(
+            f"Couldn't reach the API at [bold]{api_base_url()}[/bold]. Check your network connection and try again."
+        )
     except Exception as e:
         logger.error(e)
         console.print(
@@ -123,6 +372,280 @@ def request_data(base_url: str) -> dict:
         )
 
 
+def etag_path(request_url: str, access_token: str) -> str:
+    """Path of the stored ETag and body of a URL, kept apart for each access token."""
+    digest = hashlib.sha1(f"{access_token} {request_url}".encode()).hexdigest()
+    return os.path.join(ETAG_CACHE_DIR, digest)
+
+
+def load_etag(path: str) -> tuple:
+    """Loads a stored ETag and the response body it validates.
+
+    Returns:
+        tuple: the ETag and body, or (None, None) when nothing is stored.
+    """
+    try:
+        with open(path, "rb") as openfile:
+            etag = openfile.readline().decode().strip()
+            return etag, openfile.read()
+    except OSError:
+        return None, None
+
+
+def store_etag(path: str, etag: str, body: bytes) -> None:
+    """Stores a response body with its ETag."""
+    for _ in iter_and_store_etag(path, etag, [body]):
+        pass
+
+
+def iter_and_store_etag(path: str, etag: str, chunks) -> object:
+    """Stores a response body and its ETag as the body's chunks pass through.
+
+    Nothing is stored unless every chunk is read, so a listing cut short by
+    `--top` doesn't replace a complete one.
+
+    Args:
+        path (str): path from etag_path.
+        etag (str): the response's ETag header.
+        chunks (iterable): the decoded body.
+
+    Yields:
+        bytes: each chunk, unchanged.
+    """
+    os.makedirs(ETAG_CACHE_DIR, mode=0o700, exist_ok=True)
+    temporary_path = f"{path}.{threading.get_ident()}.tmp"
+    complete = False
+    try:
+        # Bodies hold API data, so like config.json only the owner may read them.
+        descriptor = os.open(
+            temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+        )
+        with os.fdopen(descriptor, "wb") as outfile:
+            outfile.write(f"{etag}\n".encode())
+            for chunk in chunks:
+                outfile.write(chunk)
+                yield chunk
+        complete = True
+        os.replace(temporary_path, path)
+    finally:
+        if not complete and os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    prune_etags()
+
+
+def touch_etag(path: str) -> None:
+    """Marks a stored body as recently used, keeping it from being pruned."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def prune_etags(
+    max_bytes: int = ETAG_CACHE_MAX_BYTES, max_age: float = ETAG_CACHE_MAX_AGE
+) -> None:
+    """Removes stale stored bodies, then the least recently used ones.
+
+    Args:
+        max_bytes (int): size the store is trimmed to.
+        max_age (float): seconds a body can go unused before it is removed.
+    """
+    try:
+        entries = [entry for entry in os.scandir(ETAG_CACHE_DIR) if entry.is_file()]
+    except OSError:
+        return
+    files = []
+    for entry in entries:
+        if entry.name.endswith(".tmp"):
+            continue
+        try:
+            info = entry.stat()
+        except OSError:
+            continue
+        files.append((info.st_mtime, info.st_size, entry.path))
+    files.sort(reverse=True)
+    cutoff = time.time() - max_age
+    total = 0
+    for mtime, size, path in files:
+        total += size
+        if mtime < cutoff or total > max_bytes:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def record_transfer(
+    response: requests.Response, decoded_bytes: int = 0, reused_body: bytes = None
+) -> None:
+    """Adds a response's compressed and decompressed body sizes to transfer_stats.
+
+    Args:
+        response (requests.Response): the response, after its body has been read.
+        decoded_bytes (int): size of the body after decompression.
+        reused_body (bytes): the stored body used to answer a 304 Not Modified.
+    """
+    with _transfer_lock:
+        transfer_stats["requests"] += 1
+        transfer_stats["wire_bytes"] += response.raw.tell() if response.raw else 0
+        transfer_stats["decoded_bytes"] += decoded_bytes
+        if reused_body is not None:
+            transfer_stats["not_modified"] += 1
+            transfer_stats["reused_bytes"] += len(reused_body)
+
+
+def reset_transfer_stats() -> None:
+    """Starts counting transferred bytes from zero, e.g. for a new command."""
+    with _transfer_lock:
+        transfer_stats.update(dict.fromkeys(transfer_stats, 0))
+
+
+def format_bytes(size: float) -> str:
+    """Formats a byte count for people, e.g. 2.5 MB."""
+    for unit in ["B", "kB", "MB", "GB"]:
+        if size < 1000 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1000
+
+
+def print_transfer_stats() -> None:
+    """Prints the bytes received by the command to stderr, before and after decompression."""
+    stats = dict(transfer_stats)
+    summary = (
+        f"{stats['requests']} requests: received {format_bytes(stats['wire_bytes'])}, "
+        f"{format_bytes(stats['decoded_bytes'])} decompressed"
+    )
+    if stats["wire_bytes"]:
+        summary += f" ({stats['decoded_bytes'] / stats['wire_bytes']:.1f}x)"
+    if stats["not_modified"]:
+        summary += (
+            f". {stats['not_modified']} not modified, reusing "
+            f"{format_bytes(stats['reused_bytes'])} stored"
+        )
+    if stats["cached"]:
+        summary += f". {stats['cached']} answered from memory"
+    error_console.print(
+        f"{summary}. Accepted encodings: {ACCEPT_ENCODING}.", highlight=False
+    )
+
+
+def iter_json_array(chunks) -> object:
+    """Decodes the items of a JSON array as its bytes arrive.
+
+    Args:
+        chunks (iterable): byte chunks of a UTF-8 encoded JSON array of objects.
+
+    Yields:
+        object: each decoded item of the array.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+        position = 0
+        if not started:
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            if stripped[0] != "[":
+                raise ValueError("Expected a JSON array in the response.")
+            position = len(buffer) - len(stripped) + 1
+            started = True
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(buffer) or buffer[position] == "]":
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break  # the item continues in the next chunk
+            yield item
+        buffer = buffer[position:]
+
+
+def stream_data(base_url: str) -> object:
+    """Requests a listing from the API and yields its rows as they are received.
+
+    Args:
+        base_url (str): the URL and query paramaters to be used in the request.
+
+    Yields:
+        dict: each row of the response.
+    """
+    access_token = retrieve_access_token()
+    headers = CaseInsensitiveDict()
+    headers["Accept"] = "application/json"
+    headers["Authorization"] = f"Bearer {access_token}"
+    path = etag_path(base_url, access_token)
+    etag, body = load_etag(path)
+    if etag:
+        headers["If-None-Match"] = etag
+    with session.get(
+        base_url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT
+    ) as response:
+        if response.status_code == 304 and etag:
+            record_transfer(response, reused_body=body)
+            touch_etag(path)
+            yield from iter_json_array([body])
+            return
+        response.raise_for_status()
+        chunks = response.iter_content(chunk_size=65536)
+        if response.headers.get("ETag"):
+            chunks = iter_and_store_etag(path, response.headers["ETag"], chunks)
+        decoded_bytes = 0
+
+        def count(chunks):
+            nonlocal decoded_bytes
+            for chunk in chunks:
+                decoded_bytes += len(chunk)
+                yield chunk
+
+        try:
+            yield from iter_json_array(count(chunks))
+        finally:
+            record_transfer(response, decoded_bytes)
+
+
+def list_where(
+    target_item: str,
+    where: str = None,
+    ordering: list = (),
+    limit: int = None,
+    columns: list = None,
+) -> list:
+    """List items matching a `--where` filter expression.
+
+    As much of the expression as possible is sent to the API, the rest is
+    applied to the rows as they stream in.
+
+    Args:
+        target_item (str): the target item to be listed e.g. node, port or interface.
+        where (str): the filter expression e.g. `state in (active,error) and age<7`.
+        ordering (list): (column, descending) pairs to sort by on the server.
+        limit (int): maximum number of items to return.
+        columns (list): the columns to return. Defaults to every column.
+
+    Returns:
+        list: the items matching the expression.
+    """
+    if where:
+        query, predicate = compile_where(where, target_item, columns=columns)
+    else:
+        query, predicate = f"select={','.join(columns or ['*'])}", None
+    # A client-side filter has to see every row, so the limit is applied here instead.
+    ordering = order_query(ordering, limit if predicate is None else None)
+    request_url = f"{api_base_url()}/{target_item}s?{query}"
+    if ordering:
+        request_url = f"{request_url}&{ordering}"
+    items = stream_data(request_url)
+    if predicate is not None:
+        items = filter(predicate, items)
+    return list(islice(items, limit))
+
+
 def print_search(target_item: str, response: dict, json: bool = False) -> None:
     """Prints the data requested from the API.
 
@@ -132,85 +655,218 @@ def print_search(target_item: str, response: dict, json: bool = False) -> None:
     """
 
     if response.status_code == 200:
-        response_data = response.json()
-        if len(response_data) == 0:
-            console.print(
-                "Your query returned no results. Please refine your search and try again."
-            )
-        else:
-            output_format = retrieve_output_format()
-            if output_format == "json" or json:
-                console.print_json(data=response_data)
-            else:
-                if target_item == "node":
-                    print_node_results(response_data)
-                elif target_item == "port":
-                    print_port_results(response_data)
-                elif target_item == "interface":
-                    print_interface_results(response_data)
+        print_results(target_item, response.json(), json)
     else:
         print_error_message()
 
 
-def print_port_results(response_data: list):
-    """Utility function to print node data in a table structure
+def print_results(target_item: str, response_data: list, json: bool = False) -> None:
+    """Prints a list of items as a table, or as JSON.
+
+    Args:
+        target_item (str): the type of item being printed e.g. node, port or interface.
+        response_data (list): data returned from the request_data function.
+        json (bool): whether to print the data in JSON format. Defaults to False.
+    """
+    if len(response_data) == 0:
+        console.print(
+            "Your query returned no results. Please refine your search and try again."
+        )
+    else:
+        output_format = retrieve_output_format()
+        if output_format == "json" or json:
+            console.print_json(data=response_data)
+        else:
+            if target_item == "node":
+                print_node_results(response_data)
+            elif target_item == "port":
+                print_port_results(response_data)
+            elif target_item == "interface":
+                print_interface_results(response_data)
+
+
+def fan_out(fetch, profiles: list = None) -> dict:
+    """Calls `fetch` once per API profile, querying every mesh at the same time.
+
+    Args:
+        fetch (callable): makes the request for the active profile and returns the response.
+        profiles (list): profiles to query. Defaults to every configured profile.
+
+    Returns:
+        dict: the response from each profile, or None where the request failed.
+    """
+    profiles = profiles or list_profiles()
+
+    def fetch_profile(name):
+        use_profile(name)
+        _profile_state.fanning_out = True
+        try:
+            return fetch()
+        except Exception as e:
+            logger.error(f"{name}: {e}")
+        finally:
+            _profile_state.fanning_out = False
+
+    with ThreadPoolExecutor(max_workers=len(profiles)) as executor:
+        responses = list(executor.map(fetch_profile, profiles))
+    return dict(zip(profiles, responses))
+
+
+def bind_profile(function):
+    """Wraps `function` to run with the current thread's API profile from any thread.
+
+    Args:
+        function (callable): the function to call from worker threads.
+
+    Returns:
+        callable: the wrapped function.
+    """
+    name = getattr(_profile_state, "name", None)
+
+    def bound(*args, **kwargs):
+        _profile_state.name = name
+        return function(*args, **kwargs)
+
+    return bound
+
+
+def merge_profile_results(responses: dict) -> list:
+    """Merges the responses from several profiles, tagging each item with its profile.
+
+    Profiles whose request failed are reported and left out.
+
+    Args:
+        responses (dict): responses, or lists of items, keyed by profile as returned by fan_out.
+
+    Returns:
+        list: the items from every profile that answered.
+    """
+    merged, failed = [], []
+    for name, response in responses.items():
+        if isinstance(response, list):
+            items = response
+        elif response is None or response.status_code != 200:
+            failed.append(name)
+            continue
+        else:
+            items = response.json()
+        merged.extend({"profile": name, **item} for item in items)
+    if failed:
+        console.print(
+            f"[bold red]No results from {', '.join(failed)}.[/bold red] Showing the remaining profiles."
+        )
+    return merged
+
+
+def print_table(title: str, columns: list, rows, count: int) -> None:
+    """Prints rows as a table, with rich or with the plain-text renderer.
+
+    rich is used for interactive results. Above TABLE_PLAIN_ROWS rows, or when
+    XBOT_TABLE_RENDERER is `plain`, rows are streamed as fixed-width text instead.
+
+    Args:
+        title (str): the title of the table.
+        columns (list): (header, style, no_wrap) for each column.
+        rows (iterable): tuples of strings, one value per column.
+        count (int): the number of rows.
+    """
+    renderer = TABLE_RENDERER
+    if renderer == "auto":
+        renderer = "plain" if count > TABLE_PLAIN_ROWS else "rich"
+    if renderer == "plain":
+        render_plain(console.file, title, [column[0] for column in columns], rows)
+        return
+    table = Table(title=title)
+    for header, style, no_wrap in columns:
+        table.add_column(header, justify="left", style=style, no_wrap=no_wrap)
+    for row in rows:
+        table.add_row(*row)
+    console.print(table)
+
+
+def print_port_results(response_data: list, title: str = "Results", hint: bool = True):
+    """Utility function to print port data in a table structure
 
     Args:
         response_data (list): data returned from the request_data function
+        title (str): the title of the table.
+        hint (bool): whether to print the hint about JSON output.
     """
-    table = Table(title="Results")
-    table.add_column("Number", justify="left", style="cyan", no_wrap=True)
-    table.add_column("Name", justify="left", style="magenta", no_wrap=True)
-    table.add_column("State", justify="left", style="green", no_wrap=True)
-    table.add_column("Description", justify="left", style="blue", no_wrap=False)
-    table.add_column("Associated node", justify="left", style="cyan", no_wrap=True)
-    n = 0
-    for item in response_data:
-        table.add_row(
+    show_profile = "profile" in response_data[0]
+    columns = [
+        ("Number", "cyan", True),
+        ("Name", "magenta", True),
+        ("State", "green", True),
+        ("Description", "blue", False),
+        ("Associated node", "cyan", True),
+    ]
+    if show_profile:
+        columns.insert(0, ("Profile", "yellow", True))
+    rows = (
+        ([f'{item["profile"]}'] if show_profile else [])
+        + [
             f'{item["port_number"]}',
             f'{item["name"]}',
             f'{item["port_state"]}',
             f'{item["description"]}',
             f'{item["node_id"]}',
-        )
-    console.print(table)
-    console.print(
-        f"\nHint: To view output in JSON format, append [bold cyan]--json[/bold cyan] or [bold cyan]-j[/bold cyan] to the previous command.\n"
+        ]
+        for item in response_data
     )
+    print_table(title, columns, rows, len(response_data))
+    if hint:
+        print_json_hint()
 
 
-def print_node_results(response_data: list):
-    """Utility function to print port data in a table structure
+def print_node_results(response_data: list, title: str = "Results", hint: bool = True):
+    """Utility function to print node data in a table structure
 
     Args:
         response_data (list): data returned from the request_data function
+        title (str): the title of the table.
+        hint (bool): whether to print the hint about JSON output.
     """
-    table = Table(title="Results")
-    table.add_column("Name", justify="left", style="cyan", no_wrap=True)
-    table.add_column("State", justify="left", style="magenta", no_wrap=True)
-    table.add_column("Age (days)", justify="left", style="green", no_wrap=True)
-    table.add_column("ID", justify="left", style="blue", no_wrap=False)
-    n = 0
-    for item in response_data:
-        age = get_item_age(item)
-        n += 1
-        table.add_row(
+    show_profile = "profile" in response_data[0]
+    columns = [
+        ("Name", "cyan", True),
+        ("State", "magenta", True),
+        ("Age (days)", "green", True),
+        ("ID", "blue", False),
+    ]
+    if show_profile:
+        columns.insert(0, ("Profile", "yellow", True))
+    now = datetime.datetime.now().replace(tzinfo=pytz.UTC)
+    rows = (
+        ([f'{item["profile"]}'] if show_profile else [])
+        + [
             f'{n}. {item["name"]}',
             f'{item["node_state"]}',
-            f"{age}",
+            f"{get_item_age(item, now)}",
             f'{item["id"]}',
-        )
-    console.print(table)
+        ]
+        for n, item in enumerate(response_data, 1)
+    )
+    print_table(title, columns, rows, len(response_data))
+    if hint:
+        print_json_hint()
+
+
+def print_json_hint() -> None:
+    """Prints a hint on how to view the output in JSON format."""
     console.print(
         f"\nHint: To view output in JSON format, append [bold cyan]--json[/bold cyan] or [bold cyan]-j[/bold cyan] to the previous command.\n"
     )
 
 
-def print_interface_results(response: list, json: bool = False):
-    """Utility function to print port data in a table structure
+def print_interface_results(
+    response: list, json: bool = False, title: str = "Results", hint: bool = True
+):
+    """Utility function to print interface data in a table structure
 
     Args:
         response_data (list): data returned from the request_data function
+        title (str): the title of the table.
+        hint (bool): whether to print the hint about JSON output.
     """
     try:
         response_data = response.json()
@@ -220,41 +876,49 @@ def print_interface_results(response: list, json: bool = False):
     if output_format == "json" or json:
         console.print_json(data=response_data)
     else:
-        table = Table(title="Results")
-        table.add_column("Interface ID", justify="left", style="cyan", no_wrap=True)
-        table.add_column("Sub scheme", justify="left", style="blue", no_wrap=True)
-        table.add_column("Port number", justify="left", style="green", no_wrap=True)
-        table.add_column("Node ID", justify="left", style="magenta", no_wrap=True)
-        for item in response_data:
-            table.add_row(
+        show_profile = bool(response_data) and "profile" in response_data[0]
+        columns = [
+            ("Interface ID", "cyan", True),
+            ("Sub scheme", "blue", True),
+            ("Port number", "green", True),
+            ("Node ID", "magenta", True),
+        ]
+        if show_profile:
+            columns.insert(0, ("Profile", "yellow", True))
+        rows = (
+            ([f'{item["profile"]}'] if show_profile else [])
+            + [
                 f'{item["id"]}',
                 f'{item["interface_sub_scheme"]}',
                 f'{item["port_number"]}',
                 f'{item["node_id"]}',
-            )
-        console.print(table)
-        console.print(
-            f"\nHint: To view additional output in JSON format, append [bold cyan]--json[/bold cyan] or [bold cyan]-j[/bold cyan] to the previous command.\n"
+            ]
+            for item in response_data
         )
+        print_table(title, columns, rows, len(response_data))
+        if hint:
+            console.print(
+                f"\nHint: To view additional output in JSON format, append [bold cyan]--json[/bold cyan] or [bold cyan]-j[/bold cyan] to the previous command.\n"
+            )
 
 
-def get_item_age(item: str) -> str:
+def get_item_age(item: str, now: datetime.datetime = None) -> str:
     """Calculates the age of an item.
 
     Args:
         item (object): JSON object containing the data requested based on the base_url.
+        now (datetime.datetime): the current time, when ageing many items at once.
 
     Returns:
         str: the age of the item.
     """
 
-    date_created = datetime.datetime.strptime(
-        item["date_created"], "%Y-%m-%dT%H:%M:%S.%f%z"
-    )
-    current = datetime.datetime.now().replace(tzinfo=pytz.UTC)
-    tz = pytz.timezone("Africa/Johannesburg")
-    current_time = current.astimezone(tz)
-    item_age = (current_time - date_created).days
+    date_created = parse_timestamp(item["date_created"])
+    if now is None:
+        current = datetime.datetime.now().replace(tzinfo=pytz.UTC)
+        tz = pytz.timezone("Africa/Johannesburg")
+        now = current.astimezone(tz)
+    item_age = (now - date_created).days
     return item_age
 
 
@@ -272,7 +936,7 @@ def list_by_state_and_age(
         target_item (str): the target item to be listed e.g. node, port or interface. Defaults to node.
     """
     from_datetime = datetime.datetime.now() - datetime.timedelta(age)
-    base_url = f"http://localhost:3000/{target_item}s"
+    base_url = f"{api_base_url()}/{target_item}s"
     request_url = f"{base_url}?select=*&date_created=gte.{from_datetime}&{target_item}_state=eq.{state}"
     response = request_data(request_url)
     if response:
@@ -296,7 +960,7 @@ def list_by_type_and_age(
         target_item (str): the target item to be listed e.g. node, port or interface. Defaults to node.
     """
     from_datetime = datetime.datetime.now() - datetime.timedelta(age)
-    base_url = f"http://localhost:3000/{target_item}s"
+    base_url = f"{api_base_url()}/{target_item}s"
     request_url = f"{base_url}?select=*&date_created=gte.{from_datetime}&{target_item}_type=eq.{type}"
     response = request_data(request_url)
     if response:
@@ -318,7 +982,7 @@ def list_by_type_and_state(
         state (string): ["provisioned", "started", "active", "error", "stopped", "suspended"]
         target_item (str): the target item to be listed e.g. node, port or interface. Defaults to node.
     """
-    base_url = f"http://localhost:3000/{target_item}s"
+    base_url = f"{api_base_url()}/{target_item}s"
     request_url = f"{base_url}?select=*&{target_item}_state=eq.{state}&{target_item}_type=eq.{type}"
     response = request_data(request_url)
     if response:
@@ -334,7 +998,7 @@ def list_by_item_state(state: str, target_item: str = "node", json: bool = False
         state (string): ["provisioned", "started", "active", "error", "stopped", "suspended"]
         target_item (str): the target item to be listed e.g. node, port or interface. Defaults to node.
     """
-    base_url = f"http://localhost:3000/{target_item}s"
+    base_url = f"{api_base_url()}/{target_item}s"
     request_url = f"{base_url}?select=*&{target_item}_state=eq.{state}"
     response_data = request_data(request_url)
     if response_data:
@@ -352,7 +1016,7 @@ def list_by_item_age(age: int, target_item: str = "node", json: bool = False):
         target_item (str): the target item to be listed e.g. node, port or interface. Defaults to node.
     """
     from_datetime = datetime.datetime.now() - datetime.timedelta(age)
-    base_url = f"http://localhost:3000/{target_item}s"
+    base_url = f"{api_base_url()}/{target_item}s"
     request_url = f"{base_url}?select=*&date_created=gte.{from_datetime}"
     response = request_data(request_url)
     if response:
@@ -361,6 +1025,20 @@ def list_by_item_age(age: int, target_item: str = "node", json: bool = False):
         logger.info(f"No {target_item}s provisioned within the last {age} days.")
 
 
+def list_all(target_item: str):
+    """List every item of a kind in the mesh.
+
+    Args:
+        target_item (str): the target item to be listed e.g. node, port or interface.
+
+    Returns:
+        list: a list of all the items.
+    """
+    request_url = f"{api_base_url()}/{target_item}s"
+    response_data = request_data(request_url)
+    return response_data
+
+
 def search_by_id(target_item, argument):
     """Search for an item by its ID.
 
@@ -371,28 +1049,159 @@ def search_by_id(target_item, argument):
     Returns:
         list: a list of items matching the search criteria.
     """
-    base_url = f"http://localhost:3000/{target_item}s"
+    base_url = f"{api_base_url()}/{target_item}s"
     request_url = f"{base_url}?id=eq.{argument}"
     response_data = request_data(request_url)
     return response_data
 
 
-def search_by_name(target_item: str, argument: str):
+def search_by_name(target_item: str, argument: str, ordering: str = ""):
     """Search for an item by its ID.
 
     Args:
         target_item (str): the target item to be listed e.g. node, port or interface.
         argument (str): the name of the item to be searched for.
+        ordering (str): `order=` and `limit=` parameters to add to the request.
 
     Returns:
         list: a list of items matching the search criteria.
     """
-    base_url = f"http://localhost:3000/{target_item}s"
+    base_url = f"{api_base_url()}/{target_item}s"
     request_url = f"{base_url}?name=phfts.{argument}"
+    if ordering:
+        request_url = f"{request_url}&{ordering}"
     response_data = request_data(request_url)
     return response_data
 
 
+def name_index_key(target_item: str, item: dict) -> str:
+    """Builds the key that identifies an item in the name index, e.g. a node ID."""
+    return item_key(item, ITEM_KEYS[target_item])
+
+
+def load_name_index(target_item: str, max_age: float = NAME_INDEX_TTL) -> NameIndex:
+    """Loads the name index for the active profile, refreshing it when it is too old.
+
+    Args:
+        target_item (str): the indexed item e.g. node or port.
+        max_age (float): seconds since the last refresh before the index is refreshed.
+
+    Returns:
+        NameIndex: the index.
+    """
+    cache_key = (api_base_url(), target_item)
+    index = _name_indexes.get(cache_key)
+    if index is None:
+        try:
+            with open(name_index_path(target_item), "r") as openfile:
+                index = NameIndex.from_dict(json.load(openfile))
+        except (OSError, ValueError, KeyError):
+            index = NameIndex()
+        _name_indexes[cache_key] = index
+    if not index.refreshed_at or time.time() - index.refreshed_at > max_age:
+        refresh_name_index(target_item, index)
+    return index
+
+
+def name_index_path(target_item: str) -> str:
+    """Path of the stored name index for the active profile."""
+    digest = hashlib.sha1(api_base_url().encode()).hexdigest()[:12]
+    return os.path.join(NAME_INDEX_DIR, f"{target_item}s-{digest}.json")
+
+
+def refresh_name_index(target_item: str, index: NameIndex) -> None:
+    """Updates the name index from a listing of just the key and name columns.
+
+    Args:
+        target_item (str): the indexed item e.g. node or port.
+        index (NameIndex): the index to update in place and store.
+    """
+    columns = ",".join(ITEM_KEYS[target_item] + ["name"])
+    request_url = f"{api_base_url()}/{target_item}s?select={columns}"
+    names = {
+        name_index_key(target_item, item): item["name"]
+        for item in stream_data(request_url)
+    }
+    changed, removed = index.sync(names)
+    index.refreshed_at = time.time()
+    logger.info(f"Name index for {target_item}s: {changed} updated, {removed} removed.")
+    path = name_index_path(target_item)
+    os.makedirs(NAME_INDEX_DIR, exist_ok=True)
+    with open(f"{path}.tmp", "w") as outfile:
+        json.dump(index.to_dict(), outfile)
+    os.replace(f"{path}.tmp", path)
+
+
+def search_by_keys(target_item: str, keys: list) -> list:
+    """Fetches the items with the given name index keys.
+
+    Args:
+        target_item (str): the target item e.g. node or port.
+        keys (list): keys built by name_index_key.
+
+    Returns:
+        list: the matching items, in the order the API returns them.
+    """
+    query = key_filter(target_item, keys)
+    return list(stream_data(f"{api_base_url()}/{target_item}s?{query}"))
+
+
+def key_filter(target_item: str, keys: list) -> str:
+    """Builds a PostgREST filter matching the items with the given keys.
+
+    Args:
+        target_item (str): the target item e.g. node or port.
+        keys (list): keys built by name_index_key.
+
+    Returns:
+        str: an `id=in.(...)` filter, or an `or=(and(...),...)` logic tree for
+            items with several key columns.
+    """
+    columns = ITEM_KEYS[target_item]
+    if len(columns) == 1:
+        return f"{columns[0]}=in.({','.join(keys)})"
+    conditions = []
+    for key in keys:
+        values = key.split(":", len(columns) - 1)
+        condition = ",".join(f"{c}.eq.{v}" for c, v in zip(columns, values))
+        conditions.append(f"and({condition})")
+    return f"or=({','.join(conditions)})"
+
+
+def fuzzy_search(
+    target_item: str, query: str, ordering: list = (), limit: int = None
+) -> list:
+    """Search for items by name, tolerating typos and partial names.
+
+    Matches are ranked with the local name index and then fetched from the API.
+    When the index has no match, the API's full-text name search is used instead.
+
+    Args:
+        target_item (str): the target item e.g. node or port.
+        query (str): the name, or part of the name, to search for.
+        ordering (list): (column, descending) pairs to sort by instead of the match rank.
+        limit (int): maximum number of items to return.
+
+    Returns:
+        list: the matching items, best match first.
+    """
+    index = load_name_index(target_item)
+    matches = index.search(query, limit or FUZZY_SEARCH_LIMIT)
+    if not matches:
+        response = search_by_name(target_item, query, order_query(ordering, limit))
+        if response is None:
+            return []
+        response.raise_for_status()
+        return response.json()
+    items = search_by_keys(target_item, [key for key, _ in matches])
+    if ordering:
+        return top_n(items, ordering, limit)
+    rank = {key: position for position, (key, _) in enumerate(matches)}
+    return sorted(
+        items, key=lambda item: rank.get(name_index_key(target_item, item), len(rank))
+    )
+
+
 def search_by_type(target_item: str, argument: str):
     """Search for an item by its ID.
 
@@ -403,7 +1212,7 @@ def search_by_type(target_item: str, argument: str):
     Returns:
         list: a list of items matching the search criteria.
     """
-    base_url = f"http://localhost:3000/{target_item}s"
+    base_url = f"{api_base_url()}/{target_item}s"
     request_url = f"{base_url}?{target_item}_type=eq.{argument}"
     response_data = request_data(request_url)
     return response_data
@@ -419,83 +1228,790 @@ def search_by_interface(target_item: str, argument: str):
     Returns:
         list: a list of items matching the search criteria.
     """
-    base_url = f"http://localhost:3000/{target_item}s"
+    base_url = f"{api_base_url()}/{target_item}s"
     request_url = f"{base_url}?node_id=eq.{argument}"
     response_data = request_data(request_url)
     return response_data
 
 
-def fetch_lineage(id: str) -> list:
-    """Fetch the ancestors and descendants of an item.
+def inspect_nodes(ids: list) -> object:
+    """Fetch nodes together with their ports and interfaces.
+
+    PostgREST embeds each node's ports and interfaces in the node rows, so
+    the whole topology arrives in one request per chunk of IDs.
+
+    Args:
+        ids (list): IDs of the nodes to inspect.
+
+    Yields:
+        dict: each node, with `ports` and `interfaces` lists, as it is received.
+    """
+    for start in range(0, len(ids), INSPECT_CHUNK_SIZE):
+        chunk = ",".join(ids[start : start + INSPECT_CHUNK_SIZE])
+        request_url = (
+            f"{api_base_url()}/nodes?select=*,ports(*),interfaces(*)&id=in.({chunk})"
+        )
+        yield from stream_data(request_url)
+
+
+def print_topology(nodes, json: bool = False) -> list:
+    """Prints each node followed by its ports and interfaces, as the nodes arrive.
 
     Args:
-        id (str): ID of item you're looking for the lineage of.
+        nodes (iterable): nodes with embedded `ports` and `interfaces`, from inspect_nodes.
+        json (bool): whether to print one JSON object per line instead of tables.
 
     Returns:
-        [list]: a list of items matching the search criteria.
+        list: the IDs of the nodes that were printed.
     """
-    request_url = f"http://localhost:3000/ancestor_nodes?root_node_id=eq.{id}"
-    requested_data = request_data(request_url)
-    return requested_data
+    output_format = retrieve_output_format()
+    printed = []
+    for node in nodes:
+        printed.append(node["id"])
+        if output_format == "json" or json:
+            print_json_line(node)
+            continue
+        ports = node.get("ports") or []
+        interfaces = node.get("interfaces") or []
+        console.rule(f"[bold cyan]{node['name']}[/bold cyan]")
+        print_node_results([node], title="Node", hint=False)
+        if ports:
+            print_port_results(ports, title="Ports", hint=False)
+        else:
+            console.print("This node has no ports.")
+        if interfaces:
+            print_interface_results(interfaces, title="Interfaces", hint=False)
+        else:
+            console.print("This node has no interfaces.")
+    if printed and not (output_format == "json" or json):
+        print_json_hint()
+    return printed
+
+
+def print_json_line(item: dict) -> None:
+    """Prints an item as a single line of JSON, for streaming output."""
+    console.print(json.dumps(item), markup=False, highlight=False, soft_wrap=True)
+
+
+def fetch_lineage(ids: list) -> object:
+    """Fetch the lineage rows of many nodes, a chunk of root IDs per request.
+
+    The chunks are requested at the same time and their rows are yielded as
+    each request completes.
+
+    Args:
+        ids (list): IDs of the nodes you're looking for the lineage of.
+
+    Yields:
+        dict: each ancestor_nodes row, with the `root_node_id` it belongs to.
+    """
+    fetch = bind_profile(fetch_lineage_chunk)
+    with ThreadPoolExecutor(max_workers=APPLY_CONCURRENCY) as executor:
+        futures = [
+            executor.submit(fetch, chunk) for chunk in chunked(ids, INSPECT_CHUNK_SIZE)
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def fetch_lineage_chunk(ids: list) -> list:
+    """Fetches the lineage rows of a chunk of root IDs.
+
+    The rows are streamed, so they bypass request_data's cache. While the
+    response cache is enabled they are kept for as long as a cached response.
+
+    Returns:
+        list: the ancestor_nodes rows of the chunk.
+    """
+    request_url = f"{api_base_url()}/ancestor_nodes?root_node_id=in.({','.join(ids)})"
+    cache_key = (request_url, retrieve_access_token())
+    cached = _lineage_rows.get(cache_key)
+    if cached and time.monotonic() - cached[0] < response_cache_ttl:
+        with _transfer_lock:
+            transfer_stats["cached"] += 1
+        return cached[1]
+    rows = list(stream_data(request_url))
+    if response_cache_ttl:
+        _lineage_rows[cache_key] = (time.monotonic(), rows)
+    return rows
+
+
+def lookup_node_names(ids: list) -> dict:
+    """Looks up the names of many nodes, a chunk of IDs per request.
+
+    Returns:
+        dict: node names keyed by ID. Unknown IDs are left out.
+    """
+    names = {}
+    for chunk in chunked(ids, INSPECT_CHUNK_SIZE):
+        request_url = f"{api_base_url()}/nodes?select=id,name&id=in.({','.join(chunk)})"
+        names.update((node["id"], node["name"]) for node in stream_data(request_url))
+    return names
 
 
 def print_lineage(
-    response: object,
-    id: str,
+    ids: list,
     target_lineage: str,
     tree: bool = False,
     json: bool = False,
-) -> None:
-    """Prints the lineage, i.e. ancestors or descendants, of an item.
+    names: dict = None,
+) -> list:
+    """Prints the combined lineage, i.e. ancestors or descendants, of one or more nodes.
+
+    Nodes shared by several roots are listed once. The root names are looked up
+    in one batched request while the lineage is fetched.
 
     Args:
-        response_data (list): a list of items matching the search criteria.
-        id (str): ID of the item you want to print the lineage for.
+        ids (list): IDs of the nodes you want to print the lineage for.
         target_lineage (str): ancestor or descendant.
-        tree (bool): whether to print the lineage as a tree.
-        json (bool): whether to print the lineage in JSON mode.
+        tree (bool): whether to print the lineage as a tree, with a branch per root.
+        json (bool): whether to print the lineage in JSON mode. With several roots,
+            each node is printed as one line of JSON as soon as it arrives.
+        names (dict): root names already known, keyed by ID.
+
+    Returns:
+        list: the IDs that didn't match a node.
     """
-    if response.status_code == 200:
-        response_data = response.json()
-        output_format = retrieve_output_format()
-        node = search_by_id(target_item="node", argument=id)
-        # Note: it is necessary to convert the node data to json before extracting the name.
-        node_name = node.json()[0]["name"]
-        if output_format == "json" or json:
-            console.print_json(data=response_data)
-        elif tree:
-            tree_items = [node_name]
-            tree = Tree(
-                f"\n[bold cyan]{target_lineage.upper()} TREE: {node_name.upper()}[/bold cyan]"
-            )
-            for item in response_data:
-                item_name = item[f"{target_lineage}_node_name"]
-                if item_name not in tree_items:
-                    tree.add(item_name)
-                    tree_items.append(item_name)
-            print(tree)
+    names = dict(names or {})
+    output_format = retrieve_output_format()
+    json = output_format == "json" or json
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        missing = [id for id in ids if id not in names]
+        lookup = executor.submit(bind_profile(lookup_node_names), missing)
+        rows = fetch_lineage(ids)
+        if json and len(ids) == 1:
+            console.print_json(data=list(rows))
+            names.update(lookup.result())
+            return [id for id in ids if id not in names]
+        if json:
+            names.update(lookup.result())
+        lineage, by_root, seen = {}, {id: [] for id in ids}, set()
+        for row in rows:
+            node_id = row[f"{target_lineage}_node_id"]
+            root_id = row["root_node_id"]
+            if node_id is None or node_id == root_id or (root_id, node_id) in seen:
+                continue
+            seen.add((root_id, node_id))
+            by_root[root_id].append(node_id)
+            if node_id in lineage:
+                lineage[node_id]["roots"].append(root_id)
+                continue
+            lineage[node_id] = {
+                "id": node_id,
+                "name": row[f"{target_lineage}_node_name"],
+                "category": row[f"{target_lineage}_node_category"],
+                "roots": [root_id],
+            }
+            if json:
+                print_json_line(
+                    {
+                        "root_node_id": root_id,
+                        "root_node_name": names.get(root_id),
+                        f"{target_lineage}_node_id": node_id,
+                        f"{target_lineage}_node_name": lineage[node_id]["name"],
+                        f"{target_lineage}_node_category": lineage[node_id]["category"],
+                    }
+                )
+        names.update(lookup.result())
+    if json:
+        return [id for id in ids if id not in names]
+    roots = [names.get(id, id) for id in ids]
+    if tree:
+        if len(ids) == 1:
+            title = f"{target_lineage.upper()} TREE: {roots[0].upper()}"
         else:
-            table = Table(title=f"{target_lineage.upper()}S: {node_name.upper()} \n")
-            table.add_column("Name", justify="left", style="cyan", no_wrap=True)
-            table.add_column("Category", justify="left", style="blue", no_wrap=False)
-            table.add_column("ID", justify="left", style="magenta", no_wrap=False)
-            table_items = [node_name]
-            n = 0
-            for item in response_data:
-                item_name = item[f"{target_lineage}_node_name"]
-                if item_name not in table_items:
-                    n += 1
-                    table.add_row(
-                        f'{n}: {item[f"{target_lineage}_node_name"]}',
-                        f'{item[f"{target_lineage}_node_category"]}',
-                        f'{item[f"{target_lineage}_node_id"]}',
-                    )
-                    table_items.append(item_name)
-            console.print(table)
+            title = f"{target_lineage.upper()} TREE: {len(ids)} NODES"
+        tree = Tree(f"\n[bold cyan]{title}[/bold cyan]")
+        shown = set()
+        for id, root in zip(ids, roots):
+            branch = tree if len(ids) == 1 else tree.add(f"[bold]{root}[/bold]")
+            for node_id in by_root[id]:
+                name = lineage[node_id]["name"]
+                branch.add(f"[dim]{name} (shared)[/dim]" if node_id in shown else name)
+                shown.add(node_id)
+        print(tree)
     else:
-        console.print(
-            "It looks like your access token has expired. Please run [bold cyan]xbot config -e <your_email> -p <your_password> [/bold cyan] to generate a new one."
+        if len(ids) == 1:
+            title = f"{target_lineage.upper()}S: {roots[0].upper()} \n"
+        else:
+            title = f"{target_lineage.upper()}S OF {len(ids)} NODES \n"
+        table = Table(title=title)
+        table.add_column("Name", justify="left", style="cyan", no_wrap=True)
+        table.add_column("Category", justify="left", style="blue", no_wrap=False)
+        table.add_column("ID", justify="left", style="magenta", no_wrap=False)
+        if len(ids) > 1:
+            table.add_column("Roots", justify="left", style="green", no_wrap=False)
+        for n, item in enumerate(lineage.values(), 1):
+            row = [f'{n}: {item["name"]}', f'{item["category"]}', f'{item["id"]}']
+            if len(ids) > 1:
+                row.append(", ".join(names.get(root, root) for root in item["roots"]))
+            table.add_row(*row)
+        console.print(table)
+    return [id for id in ids if id not in names]
+
+
+def load_mesh_graph() -> tuple:
+    """Loads every lineage edge and node of the active profile into a graph.
+
+    The edges and the nodes' names and states are requested at the same time.
+
+    Returns:
+        tuple: the MeshGraph, and the nodes keyed by ID.
+    """
+    base_url = api_base_url()
+    cached = _mesh_graphs.get(base_url)
+    if cached and time.monotonic() - cached[0] < response_cache_ttl:
+        return cached[1], cached[2]
+    fetch = bind_profile(lambda request_url: list(stream_data(request_url)))
+    request_urls = [
+        f"{base_url}/ancestor_nodes?select=ancestor_node_id,descendant_node_id",
+        f"{base_url}/nodes?select=id,name,node_state,node_category",
+    ]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        edges, nodes = executor.map(fetch, request_urls)
+    graph = MeshGraph(
+        (edge["ancestor_node_id"], edge["descendant_node_id"])
+        for edge in edges
+        if edge["ancestor_node_id"] and edge["descendant_node_id"]
+    )
+    nodes = {node["id"]: node for node in nodes}
+    _mesh_graphs[base_url] = (time.monotonic(), graph, nodes)
+    return graph, nodes
+
+
+def format_graph_node(id: str, nodes: dict) -> str:
+    """Formats a node's name and state, highlighting unhealthy states in red."""
+    node = nodes.get(id, {"name": id, "node_state": "unknown"})
+    state = node["node_state"]
+    if state in UNHEALTHY_STATES:
+        state = f"[bold red]{state}[/bold red]"
+    return f"{node['name']} ({state})"
+
+
+def print_impact(
+    id: str,
+    graph: MeshGraph,
+    nodes: dict,
+    upstream: bool = False,
+    category: str = None,
+    json: bool = False,
+) -> None:
+    """Prints the nodes reachable from a node, marking those only reached through unhealthy nodes.
+
+    Args:
+        id (str): ID of the node to start from.
+        graph (MeshGraph): the mesh's lineage graph.
+        nodes (dict): nodes keyed by ID, for names, categories and states.
+        upstream (bool): list ancestors instead of descendants.
+        category (str): only list nodes in this category e.g. serve.
+        json (bool): whether to print the data in JSON format. Defaults to False.
+    """
+    unhealthy = {
+        node_id
+        for node_id, node in nodes.items()
+        if node["node_state"] in UNHEALTHY_STATES
+    }
+    # Nodes still reached when traversal stops at unhealthy nodes have a healthy
+    # path from the root; every other node is degraded.
+    healthy = {node_id for node_id, _, _ in graph.bfs(id, upstream, unhealthy)}
+    rows = []
+    for node_id, depth, parent_id in graph.bfs(id, upstream):
+        node = nodes.get(node_id, {"name": node_id, "node_state": None})
+        if category and node.get("node_category") != category:
+            continue
+        rows.append(
+            {
+                "id": node_id,
+                "name": node["name"],
+                "node_category": node.get("node_category"),
+                "node_state": node["node_state"],
+                "depth": depth,
+                "via": parent_id,
+                "degraded_path": node_id not in healthy,
+            }
+        )
+    target_lineage = "ancestor" if upstream else "descendant"
+    output_format = retrieve_output_format()
+    if output_format == "json" or json:
+        console.print_json(data=rows)
+        return
+    root = format_graph_node(id, nodes)
+    target_lineage = f"{category} {target_lineage}" if category else target_lineage
+    if not rows:
+        console.print(f"No {target_lineage}s found for {root}.")
+        return
+    table = Table(title=f"{target_lineage.upper()}S OF {root}")
+    table.add_column("Depth", justify="right", style="cyan", no_wrap=True)
+    table.add_column("Name (state)", justify="left", style="magenta", no_wrap=True)
+    table.add_column("Category", justify="left", style="blue", no_wrap=True)
+    table.add_column("Via", justify="left", style="green", no_wrap=True)
+    table.add_column("ID", justify="left", style="blue", no_wrap=False)
+    for row in rows:
+        via = format_graph_node(row["via"], nodes) if row["via"] != id else "-"
+        if row["degraded_path"]:
+            via = f"{via} [bold red]![/bold red]"
+        table.add_row(
+            f'{row["depth"]}',
+            format_graph_node(row["id"], nodes),
+            f'{row["node_category"]}',
+            via,
+            f'{row["id"]}',
+        )
+    console.print(table)
+    degraded_count = sum(1 for row in rows if row["degraded_path"])
+    console.print(
+        f"\n[bold]{len(rows)}[/bold] {target_lineage}s of {root}, "
+        f"[bold red]{degraded_count}[/bold red] only reached through an unhealthy node (marked !)."
+    )
+
+
+def print_graph_path(path: list, nodes: dict, json: bool = False) -> None:
+    """Prints a path through the mesh, highlighting unhealthy nodes along it."""
+    output_format = retrieve_output_format()
+    if output_format == "json" or json:
+        console.print_json(data=[nodes.get(id, {"id": id}) for id in path])
+        return
+    console.print(" → ".join(format_graph_node(id, nodes) for id in path))
+    unhealthy = [
+        id for id in path if nodes.get(id, {}).get("node_state") in UNHEALTHY_STATES
+    ]
+    console.print(
+        f"\n{len(path) - 1} hops, [bold red]{len(unhealthy)}[/bold red] unhealthy nodes on the path."
+    )
+
+
+def print_graph_stats(stats: dict, nodes: dict, json: bool = False) -> None:
+    """Prints the summary from MeshGraph.stats, with node names and states."""
+    output_format = retrieve_output_format()
+    unhealthy = sum(
+        1 for node in nodes.values() if node["node_state"] in UNHEALTHY_STATES
+    )
+    if output_format == "json" or json:
+        console.print_json(data=dict(stats, unhealthy_nodes=unhealthy))
+        return
+    table = Table(title="MESH GRAPH")
+    table.add_column("Metric", justify="left", style="cyan", no_wrap=True)
+    table.add_column("Value", justify="right", style="magenta", no_wrap=True)
+    table.add_row("Nodes with lineage", f'{stats["nodes"]}')
+    table.add_row("Edges", f'{stats["edges"]}')
+    table.add_row("Sources (no ancestors)", f'{stats["sources"]}')
+    table.add_row("Sinks (no descendants)", f'{stats["sinks"]}')
+    table.add_row("Cycles", f'{stats["cycles"]}')
+    table.add_row("Nodes on cycles", f'{stats["nodes_on_cycles"]}')
+    table.add_row("Longest chain (hops)", f'{stats["longest_chain"]}')
+    table.add_row("Unhealthy nodes", f"{unhealthy}")
+    console.print(table)
+    for key, title in [("top_fan_in", "FAN-IN"), ("top_fan_out", "FAN-OUT")]:
+        table = Table(title=title)
+        table.add_column("Name (state)", justify="left", style="magenta", no_wrap=True)
+        table.add_column("Edges", justify="right", style="cyan", no_wrap=True)
+        table.add_column("ID", justify="left", style="blue", no_wrap=False)
+        for id, degree in stats[key]:
+            table.add_row(format_graph_node(id, nodes), f"{degree}", id)
+        console.print(table)
+
+
+def load_manifest(file, target_item: str) -> list:
+    """Reads the desired items from a YAML or JSON manifest.
+
+    Args:
+        file (io.TextIOBase): the open manifest.
+        target_item (str): the target item e.g. node or port.
+
+    Returns:
+        list: the items, listed at the top level or under e.g. a `nodes:` key.
+    """
+    text = file.read()
+    try:
+        import yaml
+    except ImportError:
+        yaml = None
+    if yaml is None:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            raise click.UsageError(
+                "Install PyYAML (`pip install PyYAML`) to read YAML manifests, or pass a JSON file."
+            )
+    else:
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise click.UsageError(f"Could not read {file.name}: {e}")
+    if isinstance(data, dict):
+        data = data.get(f"{target_item}s")
+    if not isinstance(data, list):
+        raise click.UsageError(
+            f"{file.name} should list {target_item}s at the top level or under `{target_item}s:`."
+        )
+    return data
+
+
+def list_current_items(target_item: str, desired: list) -> list:
+    """Lists the items a manifest is compared with.
+
+    Ports are only compared with the ports on the nodes the manifest mentions.
+
+    Args:
+        target_item (str): the target item e.g. node or port.
+        desired (list): the items from the manifest.
+
+    Returns:
+        list: the current items.
+    """
+    request_url = f"{api_base_url()}/{target_item}s"
+    if target_item != "port":
+        return list(stream_data(request_url))
+    node_ids = list(
+        dict.fromkeys(str(item["node_id"]) for item in desired if "node_id" in item)
+    )
+    current = []
+    for chunk in chunked(node_ids, INSPECT_CHUNK_SIZE):
+        current.extend(stream_data(f"{request_url}?node_id=in.({','.join(chunk)})"))
+    return current
+
+
+def write_headers(prefer: str) -> CaseInsensitiveDict:
+    """Builds the headers for a JSON write request with a PostgREST `Prefer` header."""
+    headers = CaseInsensitiveDict()
+    headers["Accept"] = "application/json"
+    headers["Content-Type"] = "application/json"
+    headers["Authorization"] = f"Bearer {retrieve_access_token()}"
+    headers["Prefer"] = prefer
+    return headers
+
+
+def upsert_items(target_item: str, rows: list) -> requests.Response:
+    """Creates or updates items in a single bulk request.
+
+    Rows that include every key column are merged into existing items with the
+    same key. Rows without a key, such as new nodes, are inserted.
+
+    Args:
+        target_item (str): the target item e.g. node or port.
+        rows (list): items that all have the same columns.
+
+    Returns:
+        requests.Response: the API's response.
+    """
+    columns = ITEM_KEYS[target_item]
+    request_url = f"{api_base_url()}/{target_item}s"
+    prefer = "return=minimal"
+    if all(column in rows[0] for column in columns):
+        request_url = f"{request_url}?on_conflict={','.join(columns)}"
+        prefer = f"resolution=merge-duplicates,{prefer}"
+    return session.post(
+        request_url,
+        headers=write_headers(prefer),
+        data=json.dumps(rows, default=str),
+        timeout=REQUEST_TIMEOUT,
+    )
+
+
+def delete_items(target_item: str, keys: list) -> requests.Response:
+    """Deletes the items with the given keys in a single request."""
+    request_url = f"{api_base_url()}/{target_item}s?{key_filter(target_item, keys)}"
+    return session.delete(
+        request_url, headers=write_headers("return=minimal"), timeout=REQUEST_TIMEOUT
+    )
+
+
+def send_batch(send, batch: list) -> list:
+    """Sends a batch of writes, splitting it to find the items the API rejects.
+
+    PostgREST writes a batch in one transaction, so a single invalid item fails
+    the whole batch. Rejected batches are retried in halves until each failing
+    item is found. Errors that aren't about the items, such as an expired
+    token or a server error, fail the whole batch at once.
+
+    Args:
+        send (callable): sends a list of items and returns the response.
+        batch (list): the items to send.
+
+    Returns:
+        list: (item, error message) for each item that couldn't be written.
+    """
+    try:
+        response = send(batch)
+    except requests.RequestException as e:
+        return [(item, str(e)) for item in batch]
+    if response.ok:
+        return []
+    try:
+        message = response.json()["message"]
+    except (ValueError, KeyError, TypeError):
+        message = response.text or response.reason
+    if (
+        len(batch) == 1
+        or response.status_code in (401, 403)
+        or response.status_code >= 500
+    ):
+        return [(item, f"{response.status_code}: {message}") for item in batch]
+    middle = len(batch) // 2
+    return send_batch(send, batch[:middle]) + send_batch(send, batch[middle:])
+
+
+def apply_changes(target_item: str, plan: dict, progress: bool = True) -> list:
+    """Sends the writes in a plan from changes.plan_changes.
+
+    Creates and updates go first as bulk upserts, then deletes as `in.(...)`
+    filters. Up to APPLY_CONCURRENCY batches are in flight at once.
+
+    Args:
+        target_item (str): the target item e.g. node or port.
+        plan (dict): the items to create and update and the keys to delete.
+        progress (bool): show a progress bar. Defaults to True.
+
+    Returns:
+        list: the action, item label and error message of each failed item.
+    """
+    columns = ITEM_KEYS[target_item]
+    updates = {id(item) for item in plan["update"]}
+    jobs = {
+        "write": (
+            bind_profile(partial(upsert_items, target_item)),
+            upsert_batches(plan["create"] + plan["update"], APPLY_CHUNK_SIZE),
+        ),
+        "delete": (
+            bind_profile(partial(delete_items, target_item)),
+            chunked(plan["delete"], APPLY_DELETE_CHUNK_SIZE),
+        ),
+    }
+    total = len(plan["create"]) + len(plan["update"]) + len(plan["delete"])
+    errors = []
+    with Progress(console=console, disable=not progress) as progress_bar:
+        task = progress_bar.add_task(f"Applying {target_item}s", total=total)
+        with ThreadPoolExecutor(max_workers=APPLY_CONCURRENCY) as executor:
+            for action, (send, batches) in jobs.items():
+                futures = {
+                    executor.submit(send_batch, send, batch): len(batch)
+                    for batch in batches
+                }
+                for future in as_completed(futures):
+                    for item, message in future.result():
+                        if action == "delete":
+                            failed = {"action": "delete", "item": item}
+                        else:
+                            failed = {
+                                "action": "update" if id(item) in updates else "create",
+                                "item": change_label(item, columns),
+                            }
+                        errors.append({**failed, "error": message})
+                    progress_bar.advance(task, futures[future])
+    # apply always runs in-process, so a running xbotd has to be told that the
+    # listings and graphs it holds no longer match the mesh.
+    clear_response_cache()
+    invalidate_daemon()
+    return errors
+
+
+def change_label(item: dict, columns: list) -> str:
+    """Labels an item in a plan by its key, or by its name when it has no key yet."""
+    if all(column in item for column in columns):
+        return item_key(item, columns)
+    return item.get("name", "(unnamed)")
+
+
+def print_plan(
+    target_item: str, plan: dict, details: bool = False, json: bool = False
+) -> None:
+    """Prints how many items a manifest creates, updates and deletes.
+
+    Args:
+        target_item (str): the target item e.g. node or port.
+        plan (dict): the plan from changes.plan_changes.
+        details (bool): list each change, for a dry run. Defaults to False.
+        json (bool): whether to print the data in JSON format. Defaults to False.
+    """
+    columns = ITEM_KEYS[target_item]
+    changes = [
+        {
+            "action": action,
+            "item": change_label(item, columns),
+            "name": item.get("name"),
+        }
+        for action in ["create", "update"]
+        for item in plan[action]
+    ] + [{"action": "delete", "item": key, "name": None} for key in plan["delete"]]
+    output_format = retrieve_output_format()
+    if output_format == "json" or json:
+        if details:
+            console.print_json(
+                data={"changes": changes, "unchanged": plan["unchanged"]}
+            )
+        return
+    if details and changes:
+        styles = {"create": "green", "update": "yellow", "delete": "red"}
+        table = Table(title=f"{target_item.upper()} CHANGES")
+        table.add_column("Action", justify="left", no_wrap=True)
+        table.add_column("Name", justify="left", style="magenta", no_wrap=True)
+        table.add_column("Key", justify="left", style="blue", no_wrap=False)
+        for change in changes:
+            style = styles[change["action"]]
+            table.add_row(
+                f'[{style}]{change["action"]}[/{style}]',
+                f'{change["name"] or ""}',
+                f'{change["item"]}',
+            )
+        console.print(table)
+    console.print(
+        f'[bold green]{len(plan["create"])}[/bold green] to create, '
+        f'[bold yellow]{len(plan["update"])}[/bold yellow] to update, '
+        f'[bold red]{len(plan["delete"])}[/bold red] to delete, '
+        f'{plan["unchanged"]} unchanged.'
+    )
+
+
+def print_apply_errors(
+    target_item: str, plan: dict, errors: list, json: bool = False
+) -> None:
+    """Prints the outcome of apply_changes, listing each item that failed."""
+    total = len(plan["create"]) + len(plan["update"]) + len(plan["delete"])
+    output_format = retrieve_output_format()
+    if output_format == "json" or json:
+        console.print_json(data={"applied": total - len(errors), "errors": errors})
+        return
+    if not total:
+        return
+    if errors:
+        table = Table(title="FAILED")
+        table.add_column("Action", justify="left", style="cyan", no_wrap=True)
+        table.add_column("Item", justify="left", style="blue", no_wrap=False)
+        table.add_column("Error", justify="left", style="red", no_wrap=False)
+        for error in errors:
+            table.add_row(error["action"], f'{error["item"]}', error["error"])
+        console.print(table)
+    console.print(
+        f"Applied [bold green]{total - len(errors)}[/bold green] of {total} {target_item} changes."
+    )
+
+
+def exact_count(target_item: str, query: str = "") -> int:
+    """Counts the items matching a filter without downloading them.
+
+    Args:
+        target_item (str): the target item e.g. node or port.
+        query (str): PostgREST filters e.g. `node_state=eq.active`.
+
+    Returns:
+        int: the total from the Content-Range of a `Prefer: count=exact` HEAD request.
+    """
+    headers = CaseInsensitiveDict()
+    headers["Accept"] = "application/json"
+    headers["Authorization"] = f"Bearer {retrieve_access_token()}"
+    headers["Prefer"] = "count=exact"
+    response = session.head(
+        f"{api_base_url()}/{target_item}s?{query}&limit=1",
+        headers=headers,
+        timeout=REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()
+    return int(response.headers["Content-Range"].rsplit("/", 1)[1])
+
+
+def grouped_counts(target_item: str, columns: list, values: list) -> dict:
+    """Counts items for each combination of values in `columns`.
+
+    Uses a single PostgREST aggregate query, e.g. `select=node_state,count()`.
+    Where aggregates are disabled, each combination of the known `values` is
+    counted with exact_count instead, several at a time.
+
+    Args:
+        target_item (str): the target item e.g. node or port.
+        columns (list): the columns to group by.
+        values (list): the known values of each column.
+
+    Returns:
+        dict: counts keyed by tuples of column values.
+    """
+    headers = CaseInsensitiveDict()
+    headers["Accept"] = "application/json"
+    headers["Authorization"] = f"Bearer {retrieve_access_token()}"
+    response = session.get(
+        f"{api_base_url()}/{target_item}s?select={','.join(columns)},count()",
+        headers=headers,
+        timeout=REQUEST_TIMEOUT,
+    )
+    if response.status_code == 200:
+        return {
+            tuple(row[column] for column in columns): row["count"]
+            for row in response.json()
+        }
+    combinations = list(itertools.product(*values))
+    count = bind_profile(
+        lambda combination: exact_count(
+            target_item,
+            "&".join(f"{c}=eq.{v}" for c, v in zip(columns, combination)),
+        )
+    )
+    with ThreadPoolExecutor(max_workers=APPLY_CONCURRENCY) as executor:
+        return dict(zip(combinations, executor.map(count, combinations)))
+
+
+def collect_mesh_metrics(
+    node_states: list,
+    node_types: list,
+    port_states: list,
+    profiles: list = None,
+    last_results: dict = None,
+) -> list:
+    """Counts nodes and ports in each profile's mesh for the Prometheus exporter.
+
+    A profile that fails to answer is reported as down in `xbot_up`, and its
+    counts from the last refresh it answered are exported again.
+
+    Args:
+        node_states (list): known node states, for APIs without aggregates.
+        node_types (list): known node types, for APIs without aggregates.
+        port_states (list): known port states, for APIs without aggregates.
+        profiles (list): profiles to query. Defaults to the active profile.
+        last_results (dict): each profile's last counts, updated in place and
+            kept by the caller between refreshes.
+
+    Returns:
+        list: (name, help, samples) metric families for exporter.render.
+
+    Raises:
+        requests.RequestException: when no profile answered.
+    """
+    profiles = profiles or [active_profile_name()]
+    last_results = {} if last_results is None else last_results
+
+    def collect():
+        now = datetime.datetime.now(datetime.timezone.utc)
+        nodes = grouped_counts(
+            "node", ["node_state", "node_type"], [node_states, node_types]
         )
+        ports = grouped_counts("port", ["port_state"], [port_states])
+        ages = {}
+        for days in EXPORTER_AGE_DAYS:
+            cutoff = (now - datetime.timedelta(days=days)).isoformat()
+            ages[days] = exact_count("node", f"date_created=gt.{quote(cutoff)}")
+        return nodes, ports, ages
+
+    results = fan_out(collect, profiles)
+    if all(result is None for result in results.values()):
+        raise requests.RequestException(f"No answer from {', '.join(profiles)}.")
+    up, nodes, ports, ages = [], [], [], []
+    for profile, result in results.items():
+        up.append(({"profile": profile}, int(result is not None)))
+        if result is None:
+            result = last_results.get(profile)
+            if result is None:
+                continue
+        last_results[profile] = result
+        for (state, type), count in sorted(result[0].items(), key=str):
+            nodes.append(({"profile": profile, "state": state, "type": type}, count))
+        for (state,), count in sorted(result[1].items(), key=str):
+            ports.append(({"profile": profile, "state": state}, count))
+        for days, count in result[2].items():
+            ages.append(({"profile": profile, "days": days}, count))
+    return [
+        ("xbot_up", "Whether the profile's API answered the last refresh.", up),
+        ("xbot_nodes", "Nodes by state and type.", nodes),
+        ("xbot_nodes_created_within_days", "Nodes created in the last N days.", ages),
+        ("xbot_ports", "Ports by state.", ports),
+    ]
 
 
 def print_error_message() -> None:
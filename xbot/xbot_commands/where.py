@@ -0,0 +1,529 @@
+"""Filter expressions for `--where` and `--sort` orderings, compiled to PostgREST.
+
+An expression such as `state in (active,error) and age<7 and name~'ingest'` is
+parsed into a small tree of tuples:
+
+    ("and", [children]), ("or", [children]), ("not", child)
+    ("cmp", embed, column, op, value)
+
+The value of an `=~` comparison is compiled to a regular expression while
+parsing, so an invalid pattern is reported as a syntax error.
+
+Top-level conjuncts that PostgREST can evaluate are pushed down as a single
+`and=(...)` logic tree, filters on an embedded resource (`node.state=error` on
+ports) become `nodes.node_state=...` parameters, and anything else is returned
+as a predicate to apply to the rows as they stream in.
+
+Orderings are lists of (column, descending) pairs, sent as `order=` and used to
+pick the top rows locally when results from several meshes are merged.
+"""
+import datetime
+import heapq
+import re
+
+from urllib.parse import quote
+
+TOKEN_PATTERN = re.compile(
+    r"""\s*(?:
+        (?P<paren>[(),])
+        |(?P<op><=|>=|!=|==|=~|!~|=|<|>|~)
+        |'(?P<single>(?:[^'\\]|\\.)*)'
+        |"(?P<double>(?:[^"\\]|\\.)*)"
+        |(?P<word>[^\s(),=<>!~'"]+)
+    )""",
+    re.VERBOSE,
+)
+KEYWORDS = ["and", "or", "not", "in", "is"]
+# Short field names that expand to `<target_item>_<field>`, e.g. state -> node_state.
+PREFIXED_FIELDS = ["state", "type", "category"]
+SERVER_OPERATORS = {
+    "=": "eq",
+    "==": "eq",
+    "!=": "neq",
+    "<": "lt",
+    "<=": "lte",
+    ">": "gt",
+    ">=": "gte",
+}
+# age<7 means created after now - 7 days, so the comparison flips on date_created.
+AGE_OPERATORS = {"<": "gt", "<=": "gte", ">": "lt", ">=": "lte"}
+IS_VALUES = ["null", "true", "false"]
+# Characters that must be double-quoted inside a PostgREST logic tree.
+RESERVED_CHARACTERS = re.compile(r'[,()"\\\s]')
+FIELD_PATTERN = re.compile(r"[A-Za-z_][\w.]*")
+
+
+class WhereSyntaxError(ValueError):
+    """Raised when a `--where` expression cannot be parsed."""
+
+
+class _NotPushable(Exception):
+    """Raised while compiling a node PostgREST cannot evaluate server-side."""
+
+
+def tokenize(expression: str) -> list:
+    """Splits an expression into (kind, text) tokens.
+
+    Args:
+        expression (str): the filter expression.
+
+    Returns:
+        list: tokens, where kind is one of paren, op, string, word or keyword.
+    """
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if not match:
+            raise WhereSyntaxError(
+                f"Unexpected character at position {position}: {expression[position:]!r}"
+            )
+        position = match.end()
+        if match.group("paren"):
+            tokens.append(("paren", match.group("paren")))
+        elif match.group("op"):
+            tokens.append(("op", match.group("op")))
+        elif match.group("single") is not None:
+            tokens.append(("string", re.sub(r"\\(.)", r"\1", match.group("single"))))
+        elif match.group("double") is not None:
+            tokens.append(("string", re.sub(r"\\(.)", r"\1", match.group("double"))))
+        elif match.group("word").lower() in KEYWORDS:
+            tokens.append(("keyword", match.group("word").lower()))
+        else:
+            tokens.append(("word", match.group("word")))
+    return tokens
+
+
+def parse(expression: str, target_item: str = "node") -> tuple:
+    """Parses a filter expression into a tree.
+
+    Args:
+        expression (str): the filter expression e.g. `state=active and age<7`.
+        target_item (str): the item being filtered, used to expand short field names.
+
+    Returns:
+        tuple: the root of the expression tree.
+    """
+    tokens = tokenize(expression)
+    if not tokens:
+        raise WhereSyntaxError("The filter expression is empty.")
+    parser = _Parser(tokens, target_item)
+    tree = parser.parse_or()
+    if parser.position != len(tokens):
+        raise WhereSyntaxError(f"Unexpected {parser.peek()[1]!r} in filter expression.")
+    return tree
+
+
+class _Parser:
+    """Recursive descent parser over the token list: or > and > not > comparison."""
+
+    def __init__(self, tokens: list, target_item: str):
+        self.tokens = tokens
+        self.position = 0
+        self.target_item = target_item
+
+    def peek(self) -> tuple:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return ("end", "end of expression")
+
+    def take(self, kind: str, text: str = None) -> str:
+        token = self.peek()
+        if token[0] != kind or (text is not None and token[1] != text):
+            raise WhereSyntaxError(
+                f"Expected {text or kind} but found {token[1]!r} in filter expression."
+            )
+        self.position += 1
+        return token[1]
+
+    def parse_or(self) -> tuple:
+        return self.parse_chain("or", self.parse_and)
+
+    def parse_and(self) -> tuple:
+        return self.parse_chain("and", self.parse_not)
+
+    def parse_chain(self, keyword: str, parse_operand) -> tuple:
+        """Parses operands joined by `keyword`, flattening nested groups of the same kind."""
+        children = []
+        while True:
+            child = parse_operand()
+            children.extend(child[1] if child[0] == keyword else [child])
+            if self.peek() != ("keyword", keyword):
+                break
+            self.position += 1
+        return children[0] if len(children) == 1 else (keyword, children)
+
+    def parse_not(self) -> tuple:
+        if self.peek() == ("keyword", "not"):
+            self.position += 1
+            return ("not", self.parse_not())
+        if self.peek() == ("paren", "("):
+            self.position += 1
+            tree = self.parse_or()
+            self.take("paren", ")")
+            return tree
+        return self.parse_comparison()
+
+    def parse_value(self) -> str:
+        kind, text = self.peek()
+        if kind not in ("word", "string"):
+            raise WhereSyntaxError(f"Expected a value but found {text!r}.")
+        self.position += 1
+        return text
+
+    def parse_comparison(self) -> tuple:
+        embed, column = resolve_field(self.take("word"), self.target_item)
+        kind, text = self.peek()
+        if (kind, text) == ("keyword", "in"):
+            self.position += 1
+            self.take("paren", "(")
+            values = [self.parse_value()]
+            while self.peek() == ("paren", ","):
+                self.position += 1
+                values.append(self.parse_value())
+            self.take("paren", ")")
+            return ("cmp", embed, column, "in", values)
+        if (kind, text) == ("keyword", "is"):
+            self.position += 1
+            value = self.parse_value().lower()
+            if value not in IS_VALUES:
+                raise WhereSyntaxError(f"`is` must be followed by one of {IS_VALUES}.")
+            return ("cmp", embed, column, "is", value)
+        op = self.take("op")
+        value = self.parse_value()
+        if op == "=~":
+            try:
+                value = re.compile(value)
+            except re.error as e:
+                raise WhereSyntaxError(f"Invalid regular expression {value!r}: {e}.")
+        return ("cmp", embed, column, op, value)
+
+
+def resolve_field(field: str, target_item: str) -> tuple:
+    """Expands a field name into its embedded resource and column.
+
+    Args:
+        field (str): field as written e.g. `state`, `name` or `node.state`.
+        target_item (str): the item being filtered.
+
+    Returns:
+        tuple: the embedded resource (None for the item itself) and the column name.
+    """
+    if "." in field:
+        relation, field = field.split(".", 1)
+        return f"{relation}s", resolve_field(field, relation)[1]
+    if field in PREFIXED_FIELDS:
+        return None, f"{target_item}_{field}"
+    return None, field
+
+
+def quote_value(value: str) -> str:
+    """Double-quotes a value for a PostgREST logic tree when it needs it."""
+    if RESERVED_CHARACTERS.search(value):
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}"'
+    return value
+
+
+def age_cutoff(days: str, now: datetime.datetime) -> str:
+    """Converts an age in days into the matching date_created timestamp."""
+    try:
+        days = float(days)
+    except ValueError:
+        raise WhereSyntaxError(
+            f"age must be compared with a number of days, not {days!r}."
+        )
+    return (now - datetime.timedelta(days=days)).isoformat()
+
+
+def compile_filter(tree: tuple, now: datetime.datetime) -> str:
+    """Compiles a tree into a PostgREST logic tree e.g. `or(a.eq.1,b.gt.2)`.
+
+    Raises:
+        _NotPushable: when part of the tree has to be evaluated client-side.
+    """
+    if tree[0] in ("and", "or"):
+        children = ",".join(compile_filter(child, now) for child in tree[1])
+        return f"{tree[0]}({children})"
+    if tree[0] == "not":
+        child = tree[1]
+        if child[0] == "not":
+            return compile_filter(child[1], now)
+        if child[0] in ("and", "or"):
+            return f"not.{compile_filter(child, now)}"
+        column, condition = compile_condition(child, now).split(".", 1)
+        if condition.startswith("not."):
+            return f"{column}.{condition[4:]}"
+        return f"{column}.not.{condition}"
+    return compile_condition(tree, now)
+
+
+def compile_condition(tree: tuple, now: datetime.datetime) -> str:
+    """Compiles one comparison into `column.operator.value`.
+
+    Raises:
+        _NotPushable: for embedded fields and operators PostgREST doesn't offer.
+    """
+    _, embed, column, op, value = tree
+    if embed:
+        raise _NotPushable()
+    if column == "age":
+        if op not in AGE_OPERATORS:
+            raise _NotPushable()
+        return f"date_created.{AGE_OPERATORS[op]}.{quote_value(age_cutoff(value, now))}"
+    if op in SERVER_OPERATORS:
+        return f"{column}.{SERVER_OPERATORS[op]}.{quote_value(value)}"
+    if op == "in":
+        values = ",".join(quote_value(item) for item in value)
+        return f"{column}.in.({values})"
+    if op == "is":
+        return f"{column}.is.{value}"
+    if op == "~":
+        return f"{column}.ilike.{quote_value(f'*{value}*')}"
+    if op == "!~":
+        return f"{column}.not.ilike.{quote_value(f'*{value}*')}"
+    raise _NotPushable()
+
+
+def compile_where(
+    expression: str,
+    target_item: str = "node",
+    now: datetime.datetime = None,
+    columns: list = None,
+) -> tuple:
+    """Compiles a `--where` expression into PostgREST parameters and a residual filter.
+
+    Args:
+        expression (str): the filter expression.
+        target_item (str): the item being filtered e.g. node, port or interface.
+        now (datetime): reference time for `age` comparisons. Defaults to now.
+        columns (list): the columns to select. Defaults to every column. Columns
+            the residual filter needs are selected too.
+
+    Returns:
+        tuple: the query string, and a predicate for the rows that still need
+            filtering client-side (None when the server does all the filtering).
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    tree = parse(expression, target_item)
+    conjuncts = tree[1] if tree[0] == "and" else [tree]
+    pushed, params, residual = [], [], []
+    inner_embeds, embeds = set(), set()
+    for conjunct in conjuncts:
+        embeds.update(referenced_embeds(conjunct))
+        try:
+            if conjunct[0] == "cmp" and conjunct[1]:
+                # Filters on an embedded resource only work as separate parameters.
+                condition = compile_condition(("cmp", None) + conjunct[2:], now)
+                column, condition = condition.split(".", 1)
+                params.append((f"{conjunct[1]}.{column}", condition))
+                inner_embeds.add(conjunct[1])
+            else:
+                pushed.append(compile_filter(conjunct, now))
+        except _NotPushable:
+            residual.append(conjunct)
+    if columns:
+        needed = set().union(*(referenced_columns(node) for node in residual))
+        columns = list(columns) + sorted(needed - set(columns))
+    select = (columns or ["*"]) + [
+        f"{embed}!inner(*)" if embed in inner_embeds else f"{embed}(*)"
+        for embed in sorted(embeds)
+    ]
+    params.insert(0, ("select", ",".join(select)))
+    if pushed:
+        params.append(("and", f"({','.join(pushed)})"))
+    query = "&".join(f"{key}={quote(value, safe='*(),.:!')}" for key, value in params)
+    if not residual:
+        return query, None
+    return query, lambda item: all(evaluate(node, item, now) for node in residual)
+
+
+def referenced_embeds(tree: tuple) -> set:
+    """Lists the embedded resources a tree refers to."""
+    if tree[0] in ("and", "or"):
+        return set().union(*(referenced_embeds(child) for child in tree[1]))
+    if tree[0] == "not":
+        return referenced_embeds(tree[1])
+    return {tree[1]} if tree[1] else set()
+
+
+def referenced_columns(tree: tuple) -> set:
+    """Lists the item's own columns a tree refers to, e.g. date_created for age."""
+    if tree[0] in ("and", "or"):
+        return set().union(*(referenced_columns(child) for child in tree[1]))
+    if tree[0] == "not":
+        return referenced_columns(tree[1])
+    if tree[1]:
+        return set()
+    return {"date_created" if tree[2] == "age" else tree[2]}
+
+
+def parse_timestamp(value: str) -> datetime.datetime:
+    """Parses a timestamp from the API, with or without fractional seconds.
+
+    PostgreSQL leaves the fraction out when it is zero, e.g. `2022-01-01T10:00:00+00:00`.
+    """
+    try:
+        # Much faster than strptime, which matters when ageing thousands of items.
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        # Older Pythons only accept 3 or 6 fractional digits and no `Z` suffix.
+        if "." in value:
+            return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+        return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S%z")
+
+
+def item_age(item: dict, now: datetime.datetime) -> int:
+    """Calculates the age of an item in days from its date_created."""
+    return (now - parse_timestamp(item["date_created"])).days
+
+
+def evaluate(tree: tuple, item: dict, now: datetime.datetime) -> bool:
+    """Evaluates a tree against a single row.
+
+    Args:
+        tree (tuple): the expression tree.
+        item (dict): a row returned by the API.
+        now (datetime): reference time for `age` comparisons.
+
+    Returns:
+        bool: whether the row matches.
+    """
+    if tree[0] == "and":
+        return all(evaluate(child, item, now) for child in tree[1])
+    if tree[0] == "or":
+        return any(evaluate(child, item, now) for child in tree[1])
+    if tree[0] == "not":
+        return not evaluate(tree[1], item, now)
+    _, embed, column, op, value = tree
+    if embed:
+        related = item.get(embed) or []
+        if isinstance(related, dict):
+            related = [related]
+        return any(
+            evaluate(("cmp", None, column, op, value), row, now) for row in related
+        )
+    actual = item_age(item, now) if column == "age" else item.get(column)
+    return compare(actual, op, value)
+
+
+def compare(actual, op: str, value) -> bool:
+    """Applies a single comparison operator to a row value."""
+    if op == "is":
+        return actual is {"null": None, "true": True, "false": False}[value]
+    if actual is None:
+        return op in ("!=", "!~")
+    if op == "in":
+        return any(compare(actual, "=", option) for option in value)
+    if op == "~":
+        return value.lower() in str(actual).lower()
+    if op == "!~":
+        return value.lower() not in str(actual).lower()
+    if op == "=~":
+        return value.search(str(actual)) is not None
+    try:
+        left, right = float(actual), float(value)
+    except (TypeError, ValueError):
+        left, right = str(actual), value
+    return {
+        "=": left == right,
+        "==": left == right,
+        "!=": left != right,
+        "<": left < right,
+        "<=": left <= right,
+        ">": left > right,
+        ">=": left >= right,
+    }[op]
+
+
+def parse_sort(sort: str, target_item: str = "node", descending: bool = False) -> list:
+    """Parses a comma-separated `--sort` value into an ordering.
+
+    Args:
+        sort (str): fields to sort by e.g. `state,age`.
+        target_item (str): the item being sorted, used to expand short field names.
+        descending (bool): whether to sort from largest to smallest.
+
+    Returns:
+        list: (column, descending) pairs. Sorting by age sorts date_created the other way.
+    """
+    ordering = []
+    for field in sort.split(","):
+        field = field.strip()
+        if not FIELD_PATTERN.fullmatch(field):
+            raise WhereSyntaxError(f"Can't sort by {field!r}.")
+        embed, column = resolve_field(field, target_item)
+        if embed:
+            raise WhereSyntaxError(
+                f"Sorting by {field!r} on another item isn't supported."
+            )
+        if column == "age":
+            ordering.append(("date_created", not descending))
+        else:
+            ordering.append((column, descending))
+    return ordering
+
+
+def order_query(ordering: list, limit: int = None) -> str:
+    """Compiles an ordering and row limit into PostgREST `order=` and `limit=` parameters.
+
+    Returns:
+        str: the query string, empty when there is nothing to add.
+    """
+    params = []
+    if ordering:
+        columns = ",".join(
+            f"{column}.{'desc' if descending else 'asc'}"
+            for column, descending in ordering
+        )
+        params.append(f"order={columns}")
+    if limit:
+        params.append(f"limit={limit}")
+    return "&".join(params)
+
+
+class _Descending:
+    """Wraps a sort key so that it orders from largest to smallest."""
+
+    __slots__ = ["key"]
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def sort_key(ordering: list):
+    """Builds a key function matching PostgreSQL's ordering, with nulls last when ascending."""
+
+    def key(item):
+        values = []
+        for column, descending in ordering:
+            value = item.get(column)
+            value = (value is None, value if value is not None else "")
+            values.append(_Descending(value) if descending else value)
+        return values
+
+    return key
+
+
+def top_n(items, ordering: list, limit: int = None) -> list:
+    """Sorts items locally, keeping only the first `limit` in a bounded heap.
+
+    Args:
+        items (iterable): the rows to sort.
+        ordering (list): (column, descending) pairs from parse_sort.
+        limit (int): number of rows to keep. Keeps every row when None.
+
+    Returns:
+        list: the sorted rows.
+    """
+    key = sort_key(ordering)
+    if limit is None:
+        return sorted(items, key=key)
+    return heapq.nsmallest(limit, items, key=key)
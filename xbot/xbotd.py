@@ -0,0 +1,24 @@
+import os
+
+import rich
+
+from xbot import xbot
+from xbot_commands import commands, util_functions
+from xbot_commands.daemon import CACHE_TTL, serve
+
+
+def xbotd() -> None:
+    """Runs the xbot daemon, keeping the API session and caches warm between commands."""
+    util_functions.enable_response_cache(CACHE_TTL)
+    if os.path.exists("config.json"):
+        for target_item in ["node", "port", "interface"]:
+            util_functions.list_all(target_item)
+    serve(
+        xbot,
+        consoles=[util_functions.console, commands.console, rich.get_console()],
+        on_invalidate=util_functions.clear_response_cache,
+    )
+
+
+if __name__ == "__main__":
+    xbotd()